@@ -0,0 +1,139 @@
+import argparse
+import json
+import random
+import timeit
+import classes
+import constants
+import scheduler
+import simulation
+import runSimulation
+
+
+def holdBenchmark(schedulerName, pending, operations):
+    """ Times the classic "hold" model: the scheduler is filled with
+    pending events, and then each operation pops the earliest event and
+    schedules a new one a random increment later. Returns the number
+    of hold operations per second.
+
+    :param schedulerName: Which scheduler to use (a key of SCHEDULERS).
+    :type schedulerName: str
+
+    :param pending: Number of events kept in the scheduler.
+    :type pending: int
+
+    :param operations: Number of hold operations to time.
+    :type operations: int
+    """
+    rng = random.Random(143)
+    q = scheduler.SCHEDULERS[schedulerName]()
+    for i in range(pending):
+        q.put(simulation.Event(None, None, simulation.TIMEOUT,
+                    rng.random() * constants.TIME_DELAY, None))
+
+    start = timeit.default_timer()
+    for i in range(operations):
+        event = q.get()
+        event.time = event.time + rng.random() * constants.TIME_DELAY
+        q.put(event)
+    return operations / (timeit.default_timer() - start)
+
+
+def bufferBenchmark(depth, operations):
+    """ Times a link buffer holding the given number of packets: each
+    operation puts a packet into the buffer and gets one out of it.
+    Returns the time per operation, in microseconds.
+
+    :param depth: Number of packets kept in the buffer.
+    :type depth: int
+
+    :param operations: Number of put/get pairs to time.
+    :type operations: int
+    """
+    packet = classes.Packet(None, None, "DATA", constants.DATA_SIZE, None)
+    buf = classes.bufferQueue((depth + 1) * constants.DATA_SIZE)
+    for i in range(depth):
+        buf.put(packet)
+
+    start = timeit.default_timer()
+    for i in range(operations):
+        buf.put(packet)
+        buf.get()
+    return (timeit.default_timer() - start) / operations * 1e6
+
+
+def scenarioBenchmark(schedulerName, parsed_data, tcp_type):
+    """ Runs a whole simulation with the given scheduler. Returns the
+    number of events processed and the events processed per second.
+
+    :param schedulerName: Which scheduler to use (a key of SCHEDULERS).
+    :type schedulerName: str
+
+    :param parsed_data: The network description loaded from a json file.
+    :type parsed_data: dict
+
+    :param tcp_type: Which TCP congestion control to use.
+    :type tcp_type: str
+    """
+    network = runSimulation.buildNetwork(parsed_data, quiet = True)
+    simulator = simulation.Simulator(network, tcp_type, None,
+            scheduler.SCHEDULERS[schedulerName]())
+
+    start = timeit.default_timer()
+    simulator.staticRouting()
+    events = simulator.run(stop_when_flows_complete = False).events
+
+    runSimulation.startFlows(simulator)
+    events += simulator.run().events
+    return events, events / (timeit.default_timer() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Compare the event schedulers.')
+
+    parser.add_argument('--json', '-j', action = 'store', dest = 'json_file_name',
+                        help = 'Also time a full simulation of the network stored in json file')
+
+    tcp_type = parser.add_mutually_exclusive_group()
+    tcp_type.add_argument('--Reno', dest = 'tcp_type',
+            action = 'store_const', const = 'Reno', default = 'Reno',
+            help = 'Use the TCP-Reno congestion control algorithm')
+
+    tcp_type.add_argument("--FAST", dest = 'tcp_type',
+            action = 'store_const', const = 'FAST',
+            help = 'Use the TCP-FAST congestion control algorithm')
+
+    parser.add_argument('--pending', nargs = '+', type = int,
+            action = 'store', dest = 'pending', default = [1000, 100000, 1000000],
+            help = 'Pending event set sizes for the hold benchmark')
+
+    parser.add_argument('--operations', type = int,
+            action = 'store', dest = 'operations', default = 200000,
+            help = 'Number of hold operations timed per size')
+
+    parser.add_argument('--buffer-depths', nargs = '+', type = int,
+            action = 'store', dest = 'buffer_depths', default = [10, 1000, 100000],
+            help = 'Buffer depths (in packets) for the link buffer benchmark')
+
+    args = parser.parse_args()
+
+    print "Hold benchmark (operations per second):"
+    for pending in args.pending:
+        for name in sorted(scheduler.SCHEDULERS):
+            rate = holdBenchmark(name, pending, args.operations)
+            print "%10d pending  %-10s %12.0f" % (pending, name, rate)
+
+    print "Link buffer benchmark (microseconds per put/get):"
+    for depth in args.buffer_depths:
+        cost = bufferBenchmark(depth, args.operations)
+        print "%10d packets  %12.3f" % (depth, cost)
+
+    if args.json_file_name:
+        parsed_data = json.loads(open(args.json_file_name).read())
+        print "Simulation of", args.json_file_name, args.tcp_type, "(events per second):"
+        for name in sorted(scheduler.SCHEDULERS):
+            events, rate = scenarioBenchmark(name, parsed_data, args.tcp_type)
+            print "%-10s %10d events %12.0f" % (name, events, rate)
+
+
+if __name__ == "__main__":
+    main()
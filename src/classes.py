@@ -1,4 +1,6 @@
+import collections
 import constants
+import numpy as np
 import sys
 from math import *
 
@@ -7,19 +9,25 @@ class bufferQueue:
     def __init__(self, size):
         """ Initializes a buffer queue for the link
 
-        :param size: size of queue (in packets)
+        :param size: size of queue (in bytes)
         :type size: Integer
         """
 
-        self.packets = []
+        # Packets enter on the right and leave from the left.
+        self.packets = collections.deque()
         self.maxSize = size
         self.occupancy = 0
 
+    def __len__(self):
+        """ Returns the number of packets in the buffer.
+        """
+        return len(self.packets)
+
     def empty(self):
         """ Checks to see if the size of the buffer is 0.
         """
 
-        return self.packets == []
+        return not self.packets
 
     def put(self, packet):
         """ Puts a packet into the buffer, first in first out.
@@ -27,16 +35,16 @@ class bufferQueue:
         :param packet: The packet to put into the buffer
         :type packet: Packet
         """
-        self.packets.insert(0, packet)
+        self.packets.append(packet)
         self.occupancy += packet.data_size
 
     def get(self):
         """ Pops a packet from the buffer, first in first out.
         """
 
-        if self.empty():
+        if not self.packets:
             raise BufferError("Tried to get element from empty bufferQueue")
-        packet = self.packets.pop()
+        packet = self.packets.popleft()
         self.occupancy -= packet.data_size
         return packet
 
@@ -49,9 +57,9 @@ class bufferQueue:
         """ Returns the next "poppable" element, without actually popping it.
         """
 
-        if self.empty():
+        if not self.packets:
             raise BufferError("Tried to peek element from empty bufferQueue")
-        return self.packets[len(self.packets) - 1]
+        return self.packets[0]
 
     def bufferFullWith(self, packet):
         """Returns True if packet cannot be added to the buffer queue, False otherwise."""
@@ -79,14 +87,106 @@ class Network:
         self.links = links
         self.flows = flows
 
+        # Number of flows that have finished sending, kept up to date by
+        # the flows themselves.
+        self.completedFlows = 0
+
+        for flowID in self.flows:
+            self.flows[flowID].network = self
+
+        # Forwarding arrays refer to destinations by their index in sorted
+        # deviceID order.
+        for index, deviceID in enumerate(sorted(self.devices)):
+            self.devices[deviceID].deviceIndex = index
+        for deviceID in self.devices:
+            if isinstance(self.devices[deviceID], Router):
+                self.devices[deviceID].network = self
+                self.devices[deviceID].buildForwarding()
+
+        # Bumped by the routers whenever one of their tables changes, so
+        # that flows know when their cached paths are stale.
+        self.routingVersion = 0
+
+        # The state of every link and flow, in sorted ID order.
+        self.state = NetworkState([self.links[linkID] for linkID in sorted(self.links)],
+                [self.flows[flowID] for flowID in sorted(self.flows)])
+
     def allFlowsComplete(self):
         """ Checks to see if all flows have finished sending
         their required data amount. """
-        for flowID in self.flows:
-            flow = self.flows[flowID]
-            if(not flow.flowComplete()):
-                return False
-        return True
+        return self.completedFlows == len(self.flows)
+
+
+# Columns of NetworkState.links.
+#   LINK_OCCUPANCY: bytes in the link buffer.
+#   LINK_IN_FLIGHT: bytes propagating on the link.
+#   LINK_DROPS: packets dropped so far.
+#   LINK_BYTES_SENT: bytes transmitted so far.
+LINK_OCCUPANCY = 0
+LINK_IN_FLIGHT = 1
+LINK_DROPS = 2
+LINK_BYTES_SENT = 3
+LINK_FIELDS = 4
+
+# Columns of NetworkState.flows.
+#   FLOW_WINDOW: window size, in packets.
+#   FLOW_DELAY: RTT of the last packet acknowledged, in ms.
+#   FLOW_DELAY_SUM: sum of the RTTs of the packets acknowledged so far.
+#   FLOW_DELAY_COUNT: number of packets acknowledged so far.
+FLOW_WINDOW = 0
+FLOW_DELAY = 1
+FLOW_DELAY_SUM = 2
+FLOW_DELAY_COUNT = 3
+FLOW_FIELDS = 4
+
+
+class NetworkState:
+    """The state of every link and flow of a network, kept in NumPy
+    tables with one row per link or flow. Links and flows update their
+    row in place as packets move, so the state of the whole network can
+    be sampled with a single array copy."""
+
+    def __init__(self, links, flows):
+        """ Takes over the state of the links and flows: from now on, each
+        of them updates its row of the tables.
+
+        :param links: The links, in the order of their rows.
+        :type links: list<Link>
+
+        :param flows: The flows, in the order of their rows.
+        :type flows: list<Flow>
+        """
+        self.linkIDs = [link.linkID for link in links]
+        self.flowIDs = [flow.flowID for flow in flows]
+        self.linkIndex = dict((ID, index) for index, ID in enumerate(self.linkIDs))
+        self.flowIndex = dict((ID, index) for index, ID in enumerate(self.flowIDs))
+
+        # Both tables are views into a single array.
+        self.values = np.zeros(len(links) * LINK_FIELDS + len(flows) * FLOW_FIELDS)
+        self.links, self.flows = self.split(self.values)
+
+        for index, link in enumerate(links):
+            self.links[index] = link.state
+            link.state = self.links[index]
+        for index, flow in enumerate(flows):
+            self.flows[index] = flow.state
+            flow.state = self.flows[index]
+
+    def split(self, values):
+        """ Returns the link and flow tables stored in an array.
+
+        :param values: The array holding both tables.
+        :type values: numpy.ndarray
+        """
+        linkValues = len(self.linkIDs) * LINK_FIELDS
+        return (values[:linkValues].reshape(len(self.linkIDs), LINK_FIELDS),
+                values[linkValues:].reshape(len(self.flowIDs), FLOW_FIELDS))
+
+    def snapshot(self):
+        """ Returns a copy of the link and flow tables, which is not
+        changed by the simulation.
+        """
+        return self.split(self.values.copy())
 
 
 class Device(object):
@@ -104,6 +204,9 @@ class Device(object):
         """
         self.deviceID = deviceID
 
+        # Index of the device in the network, set by Network.
+        self.deviceIndex = None
+
         self.links = []
         self.neighbors = []
 
@@ -159,6 +262,33 @@ class Router(Device):
         # rout_table[device] = (distance to that device, link to rout packets to)
 
         self.rout_table = {}
+
+        # forwarding[deviceIndex] = link to rout packets to, rebuilt from
+        # rout_table whenever the table changes, so forwarding a packet is
+        # a single list index.
+        self.forwarding = []
+
+        # Every change of rout_table bumps tableVersion. RoutingPackets
+        # never refer to the live table: the first packet of a routing
+        # round carries a snapshot of the table, which is copied once per
+        # version and shared by all the packets sent until the table
+        # changes, and later packets only carry the entries which changed.
+        self.tableVersion = 0
+        self.snapshot = None
+
+        # The Network the router belongs to, which counts table changes.
+        self.network = None
+
+        # Devices whose entry changed during the current routing round, in
+        # order, and sent[neighbor] = (length of changeLog, latency) when
+        # the last packet was sent to that neighbor.
+        self.changeLog = []
+        self.sent = {}
+
+        # seen[router] = (version, latency) of the last table processed
+        # from that router.
+        self.seen = {}
+
         self.initializeNeighborsTable()
 
         self.routing_table_recently_updated = True
@@ -183,6 +313,7 @@ class Router(Device):
             self.rout_table[otherDev] = (link.delay, link)
 
         self.rout_table[self] = (0, None)
+        self.startRound()
 
     def initializeRerout(self):
         """Calculates a new routing for the network
@@ -198,6 +329,56 @@ class Router(Device):
         for link in self.links:
             otherDev = link.otherDevice(self)
             self.rout_table[otherDev] = (link.calcExpectedLatency(), link)
+        self.startRound()
+
+    def setRoutingTable(self, table):
+        """Replaces the routing table with one computed elsewhere.
+
+        :param table: The new table, in the same format as rout_table.
+        :type table: dict
+        """
+        self.rout_table = table
+        self.startRound()
+
+    def startRound(self):
+        """Called when the whole routing table was reset: the next packet
+        sent to each neighbor carries the whole table.
+        """
+        self.changeLog = []
+        self.sent = {}
+        self.tableChanged()
+
+    def tableChanged(self):
+        """Must be called after rout_table is changed as a whole: starts a
+        new version of the table and rebuilds the forwarding array.
+        """
+        self.newVersion()
+        self.buildForwarding()
+
+    def newVersion(self):
+        """Starts a new version of the table.
+        """
+        self.tableVersion += 1
+        self.snapshot = None
+        if self.network is not None:
+            self.network.routingVersion += 1
+
+    def entryChanged(self, device):
+        """Must be called after the entry of a device in rout_table is
+        changed: logs the change and updates the forwarding array. The
+        version of the table is bumped separately, once per update.
+
+        :param device: The device whose entry changed.
+        :type device: Device
+        """
+        self.changeLog.append(device)
+
+        index = device.deviceIndex
+        if index is None:
+            return
+        if index >= len(self.forwarding):
+            self.forwarding.extend([None] * (index + 1 - len(self.forwarding)))
+        self.forwarding[index] = self.rout_table[device][1]
 
     def handleRoutingPacket(self, packet):
         """Updates routing table if appropriate. Returns if router should send table to neighbors."""
@@ -208,17 +389,27 @@ class Router(Device):
         link = packet.currLink
         link.decrRate(packet)
 
-        for device in packet.table:
-            dist = packet.latency + packet.table[device][0]
+        # Skip versions of the sender's table that were already processed.
+        last = self.seen.get(packet.src)
+        if last is None or packet.version > last[0] or packet.latency != last[1]:
+            self.seen[packet.src] = (packet.version, packet.latency)
 
-            if(device not in self.rout_table):
-                self.rout_table[device] = (dist, packet.link)
-                updated = True
-            else:
-                mindist = self.rout_table[device][0]
-                if(dist < mindist):
+            for device in packet.table:
+                dist = packet.latency + packet.table[device][0]
+
+                if(device not in self.rout_table):
                     self.rout_table[device] = (dist, packet.link)
+                    self.entryChanged(device)
                     updated = True
+                else:
+                    mindist = self.rout_table[device][0]
+                    if(dist < mindist):
+                        self.rout_table[device] = (dist, packet.link)
+                        self.entryChanged(device)
+                        updated = True
+
+        if updated:
+            self.newVersion()
 
         # Router sends table to adjacent neighbors if recently updated or just updated
         temp = self.routing_table_recently_updated
@@ -226,12 +417,14 @@ class Router(Device):
         return temp or updated
 
     def floodNeighbors(self, dynamic = False):
-        """Returns array of tuples (packet, link) to send
+        """Returns array of tuples (packet, link) to send. A neighbor gets
+        the whole table once per routing round (or when the latency of the
+        link changes), and then only the entries which changed since the
+        last packet sent to it; neighbors with nothing new are skipped.
 
         :param dynamic: True if using dynamic routing, false otherwise
         :type dynamic: bool
         """
-
         # Send current table to all neighbors
         res = []
         for link in self.links:
@@ -239,28 +432,57 @@ class Router(Device):
             if(isinstance(otherDev, Host)):
                 continue
 
-            if(dynamic):
-                routPacket = RoutingPacket(self, otherDev, link, constants.ROUTING_SIZE,
-                                        self.rout_table, str(self.deviceID) + " ROUT", curr_loc = None,
-                                        latency = link.calcExpectedLatency())
+            latency = link.calcExpectedLatency() if dynamic else None
+            if not latency:
+                latency = link.delay
+
+            last = self.sent.get(otherDev)
+            self.sent[otherDev] = (len(self.changeLog), latency)
+            if last is None or last[1] != latency:
+                # The neighbor adds the latency to every entry, so they
+                # are all new to it.
+                if self.snapshot is None:
+                    self.snapshot = dict(self.rout_table)
+                table = self.snapshot
             else:
-                routPacket = RoutingPacket(self, otherDev, link, constants.ROUTING_SIZE,
-                                       self.rout_table, str(self.deviceID) + " ROUT", curr_loc = None)
-
+                # Routes through the neighbor itself can never shorten its
+                # own (split horizon).
+                table = {}
+                for device in self.changeLog[last[0]:]:
+                    entry = self.rout_table[device]
+                    if entry[1] is not link:
+                        table[device] = entry
+                if not table:
+                    continue
+
+            routPacket = RoutingPacket(self, otherDev, link, constants.ROUTING_SIZE,
+                                    table, curr_loc = None, latency = latency,
+                                    version = self.tableVersion)
             res.append((routPacket, link))
         return res
 
-    def transferTo(self, packet):
-        """ Returns the link that the packet will be forwarded to.
+    def buildForwarding(self):
+        """Rebuilds the forwarding array from the routing table.
+        """
+        forwarding = []
+        for device in self.rout_table:
+            index = device.deviceIndex
+            if index is None:
+                # Not part of a network yet: it is indexed later.
+                continue
+            if index >= len(forwarding):
+                forwarding.extend([None] * (index + 1 - len(forwarding)))
+            forwarding[index] = self.rout_table[device][1]
+        self.forwarding = forwarding
+
+    def forward(self, packet):
+        """ Returns the link that the packet will be forwarded to, from the
+        forwarding array, by the index of the packet's destination.
 
         :param packet: packet that will be transferred
-        :type packet: Packet
+        :type packet: DataPacket
         """
-        prevLink = packet.currLink
-        prevLink.decrRate(packet)
-
-        nextLink = self.rout_table[packet.dest][1]
-        return nextLink
+        return self.forwarding[packet.destIndex]
 
 class Host(Device):
     """A Device which contains a link and deals with packet receiving/sending."""
@@ -290,6 +512,117 @@ class Host(Device):
 
         # if packet is ROUTING, do nothing
 
+class AckScoreboard:
+    """Records which packets of a flow have been acknowledged, one byte per
+    packet. The acknowledged packets past the first unacknowledged one are
+    also kept as runs of consecutive indices, so the cumulative ACK point
+    jumps over a whole run at once when the gap before it is filled."""
+
+    def __init__(self, size):
+        """ Instantiates a scoreboard with no packet acknowledged.
+
+        :param size: Number of packets in the flow.
+        :type size: int
+        """
+        self.acked = bytearray(size)
+
+        # Every packet before this index is acknowledged.
+        self.cumulative = 0
+
+        # Runs of acknowledged packets after the cumulative ACK point, as
+        # start -> end and end -> start (end is exclusive).
+        self.runEnds = {}
+        self.runStarts = {}
+
+    def __len__(self):
+        return len(self.acked)
+
+    def __getitem__(self, index):
+        return self.acked[index] == 1
+
+    def mark(self, index):
+        """ Marks a packet as acknowledged. Returns False if it already was.
+
+        :param index: Index of the acknowledged packet.
+        :type index: int
+        """
+        if self.acked[index]:
+            return False
+        self.acked[index] = 1
+
+        # Merge with the run that starts right after the packet.
+        end = index + 1
+        if end in self.runEnds:
+            newEnd = self.runEnds.pop(end)
+            del self.runStarts[newEnd]
+            end = newEnd
+
+        if index == self.cumulative:
+            self.cumulative = end
+            return True
+
+        # Merge with the run that ends right before the packet.
+        start = index
+        if start in self.runStarts:
+            newStart = self.runStarts.pop(start)
+            del self.runEnds[newStart]
+            start = newStart
+        self.runEnds[start] = end
+        self.runStarts[end] = start
+        return True
+
+
+class PacketTable:
+    """Per-packet state of a flow, kept as one NumPy array per field and
+    indexed by sequence number, so that statistics over all the packets
+    of a flow are vectorized reductions."""
+
+    def __init__(self, size):
+        """ Instantiates the table of a flow with no packet sent.
+
+        :param size: Number of packets in the flow.
+        :type size: int
+        """
+        # Time of the latest (re)transmission, and of the first ACK, in ms.
+        self.sendTime = np.full(size, np.nan)
+        self.ackTime = np.full(size, np.nan)
+
+        # Number of times the packet was sent again.
+        self.retransmits = np.zeros(size, dtype = np.int32)
+
+        # Round trip time measured by the first ACK, in ms.
+        self.rtt = np.full(size, np.nan)
+
+    def __len__(self):
+        return len(self.sendTime)
+
+    def statistics(self):
+        """ Returns a dict of statistics over the packets sent so far:
+        the number of packets sent and acknowledged, the retransmission
+        rate, and the mean, median, 95th percentile and maximum RTT (ms).
+        """
+        sent = ~np.isnan(self.sendTime)
+        acked = ~np.isnan(self.ackTime)
+        stats = {
+            'sent': int(np.count_nonzero(sent)),
+            'acknowledged': int(np.count_nonzero(acked)),
+            'retransmissions': int(self.retransmits.sum()),
+        }
+        stats['retransmission_rate'] = \
+            float(stats['retransmissions']) / stats['sent'] if stats['sent'] else 0.0
+
+        rtt = self.rtt[acked]
+        if rtt.size:
+            stats['rtt_mean'] = float(rtt.mean())
+            stats['rtt_median'] = float(np.median(rtt))
+            stats['rtt_p95'] = float(np.percentile(rtt, 95))
+            stats['rtt_max'] = float(rtt.max())
+        else:
+            stats['rtt_mean'] = stats['rtt_median'] = None
+            stats['rtt_p95'] = stats['rtt_max'] = None
+        return stats
+
+
 class Flow:
     """A more complicated class which deals with congestion control (including TCP Reno and TCP Fast), generating/receiving and handling packets, and more."""
 
@@ -314,8 +647,8 @@ class Flow:
         :param window_size: Window size in packets
         :type window_size: int
 
-        :param packets: List of all packet ID's generated by flow, aka needed to be sent.
-        :type packets: List<int>
+        :param packets: Packets created by the flow and not acknowledged yet, by index.
+        :type packets: Dict<int, DataPacket>
 
         :param theoRTT: The theoretical round trip time of a packet in this flow.
         :type theoRTT: int
@@ -343,9 +676,10 @@ class Flow:
         self.first_time = 0
 
         # Congestion Control Variables
-        self.packets = []
-        self.acksAcknowledged = [] # Array of bools that will go from false to true
-                                   # when an ack is received.
+        self.numPackets = 0 # Number of packets the flow sends.
+        self.packets = {} # Packets created and not acknowledged yet, by index.
+        self.scoreboard = AckScoreboard(0) # Which packets have been acknowledged.
+        self.packetTable = PacketTable(0) # Send/ACK times, retransmits, RTTs.
         self.window_upper = 0
         self.packets_index = 0
         self.window_lower = 0
@@ -358,6 +692,23 @@ class Flow:
         # How much successfully sent.
         self.data_acknowledged = 0
 
+        # Number of packets not acknowledged yet; None until the packets
+        # are created.
+        self.outstanding = None
+
+        # Time (in ms) the last packet was acknowledged, or None.
+        self.completion_time = None
+
+        # The Network the flow belongs to, which counts completed flows.
+        self.network = None
+
+        # Next link of the flow's DATA (forward) and ACK (reverse) packets
+        # at each router, by deviceIndex. The paths are only valid while
+        # the network's routingVersion is pathVersion.
+        self.forwardPath = []
+        self.reversePath = []
+        self.pathVersion = None
+
         # Whether it has received a packet or not in the last fast-tcp cycle
         self.received_packet = False
 
@@ -367,6 +718,23 @@ class Flow:
         # last received packet's RTT. Used for logging packet delay.
         self.packet_delay = 0
 
+        # Sum and number of the RTTs of the packets acknowledged so far.
+        # They are counted here, and stored into the state table, since
+        # adding to a NumPy element in place is several times slower.
+        self.delaySum = 0
+        self.delayCount = 0
+
+        # Row of the flow in its Network's state table (see NetworkState).
+        self.state = np.zeros(FLOW_FIELDS)
+        self.state[FLOW_WINDOW] = self.window_size
+
+        # Armed retransmission timers, by packet index.
+        self.retransmitTimers = {}
+
+        # ACK packets that have been consumed, and can be reused by
+        # generateAckPacket instead of allocating new ones.
+        self.ackPool = []
+
     def __str__(self):
         s = "Flow ID is: " + str(self.flowID)
         s += "\nSource is: " + str(self.src)
@@ -376,27 +744,102 @@ class Flow:
         return s
 
     def flowComplete(self):
-        """ Returns True if flow is done sending, False otherwise """
-        for s in self.acksAcknowledged:
-            if s == False:
-                return False
-        return True
+        """ Returns True if flow is done sending, False otherwise
+        (including before its packets are created). """
+        return self.outstanding == 0
 
-    def initializePackets(self):
-        """ We will create all the packets and put them into
-            an array.
+    def acknowledge(self, index, currentTime, sendTime):
+        """ Marks a packet as acknowledged, and records the completion of
+        the flow when it was the last one outstanding.
+
+        :param index: Index of the acknowledged packet.
+        :type index: int
+
+        :param currentTime: The time of the acknowledgement, in ms.
+        :type currentTime: float
+
+        :param sendTime: When the acknowledged transmission was sent, in ms.
+        :type sendTime: float
+        """
+        if not self.scoreboard.mark(index):
+            return
+        self.packetTable.ackTime[index] = currentTime
+        self.packetTable.rtt[index] = currentTime - sendTime
+        self.packets.pop(index, None)
+        self.outstanding = self.outstanding - 1
+        if self.outstanding == 0:
+            self.complete(currentTime)
+
+    def complete(self, currentTime):
+        """ Records that the flow has finished sending.
+
+        :param currentTime: The time the flow finished, in ms.
+        :type currentTime: float
         """
+        self.completion_time = currentTime
+        if self.network is not None:
+            self.network.completedFlows = self.network.completedFlows + 1
+
+    def tracePath(self, start, end):
+        """ Returns the path from one end of the flow to the other, as the
+        next link at each router, by deviceIndex. Routers off the path
+        are filled in when a packet reaches them.
+
+        :param start: The host the path starts from.
+        :type start: Host
 
-        index = 0
+        :param end: The host the path leads to.
+        :type end: Host
+        """
+        path = [None] * len(self.network.devices)
+        device = start.getLink().otherDevice(start)
+        while isinstance(device, Router) and path[device.deviceIndex] is None:
+            forwarding = device.forwarding
+            if end.deviceIndex >= len(forwarding) or forwarding[end.deviceIndex] is None:
+                # Routing has not reached the end yet.
+                break
+            link = forwarding[end.deviceIndex]
+            path[device.deviceIndex] = link
+            device = link.otherDevice(device)
+        return path
+
+    def nextLink(self, router, packet):
+        """ Returns the link a packet of the flow is forwarded to by a
+        router, from the cached paths. The paths are traced again once
+        any routing table has changed.
+
+        :param router: The router the packet is at.
+        :type router: Router
+
+        :param packet: A DATA or ACK packet of the flow.
+        :type packet: DataPacket
+        """
+        if self.pathVersion != self.network.routingVersion:
+            self.forwardPath = self.tracePath(self.src, self.dest)
+            self.reversePath = self.tracePath(self.dest, self.src)
+            self.pathVersion = self.network.routingVersion
+
+        path = self.forwardPath if packet.dest is self.dest else self.reversePath
+        link = path[router.deviceIndex]
+        if link is None:
+            # Off the traced path, e.g. for a packet sent before the
+            # routes changed.
+            link = router.forward(packet)
+            path[router.deviceIndex] = link
+        return link
 
-        while(self.current_amt < self.data_amt):
-            packetID = self.flowID + "token" + str(index)
-            packet = DataPacket(index, self.src, self.dest, "DATA", constants.DATA_SIZE, packetID, None, flow = self)
-            self.packets.append(packet)
-            self.acksAcknowledged.append(False)
-            self.current_amt = self.current_amt + constants.DATA_SIZE
-            index = index + 1
+    def initializePackets(self):
+        """ Splits the data into packets of DATA_SIZE bytes. The packets
+            themselves are only created when they are sent (see getPacket).
+        """
+        self.numPackets = int(ceil(float(self.data_amt) / constants.DATA_SIZE))
+        self.current_amt = self.numPackets * constants.DATA_SIZE
 
+        self.scoreboard = AckScoreboard(self.numPackets)
+        self.packetTable = PacketTable(self.numPackets)
+        self.outstanding = self.numPackets
+        if self.outstanding == 0:
+            self.complete(self.flow_start)
 
     def checkIfAcked(self, packetId):
         """ We will check if a particular packet has been acked.
@@ -406,20 +849,83 @@ class Flow:
             :type packetId: str
 
         """
-        return self.acksAcknowledged[packetId] == True
+        return self.scoreboard[packetId]
+
+    def packetName(self, index):
+        """ Returns a readable name for the packet with the given index,
+            used when tracing.
+
+        :param index: Index of the packet in the flow.
+        :type index: int
+        """
+        return self.flowID + "token" + str(index)
+
+    def getPacket(self, index):
+        """ Returns the data packet with the given index, creating it if it
+            has not been sent yet, or was acknowledged already. A packet
+            is kept until it is acknowledged, so resends reuse it.
+
+        :param index: Index of the packet in the flow.
+        :type index: int
+        """
+        packet = self.packets.get(index)
+        if packet is None:
+            packet = DataPacket(index, self.src, self.dest, "DATA", constants.DATA_SIZE,
+                                None, flow = self)
+            if not self.scoreboard[index]:
+                self.packets[index] = packet
+        return packet
+
+    def recordSend(self, index, currentTime):
+        """ Records that a packet is sent for the first time.
+
+        :param index: Index of the packet.
+        :type index: int
+
+        :param currentTime: The time it is sent, in ms.
+        :type currentTime: float
+        """
+        self.packetTable.sendTime[index] = currentTime
+
+    def recordRetransmit(self, index, currentTime):
+        """ Records that a packet is sent again (RESEND or TIMEOUT).
+
+        :param index: Index of the packet.
+        :type index: int
 
+        :param currentTime: The time it is sent, in ms.
+        :type currentTime: float
+        """
+        self.packetTable.sendTime[index] = currentTime
+        self.packetTable.retransmits[index] += 1
+
+    def statistics(self):
+        """ Returns the statistics of the flow's packets (see
+        PacketTable.statistics), along with the goodput in Mbps: the data
+        acknowledged over the time from the start of the flow to its
+        last acknowledgement.
+        """
+        stats = self.packetTable.statistics()
+        stats['goodput'] = None
+        if stats['acknowledged']:
+            lastAck = np.nanmax(self.packetTable.ackTime)
+            if lastAck > self.flow_start:
+                stats['goodput'] = (float(stats['acknowledged']) * constants.DATA_SIZE *
+                        constants.B_to_b / (constants.MB_TO_KB * constants.KB_TO_B) /
+                        ((lastAck - self.flow_start) / constants.s_to_ms))
+        return stats
 
     def selectDataPacket(self):
         """ When we call SELECTPACK events, we
             just send in the next packet that can be sent in the
-            array. (This is tracked by packets_index).
+            flow. (This is tracked by packets_index).
         """
 
-        if self.packets_index >= len(self.packets):
+        if self.packets_index >= self.numPackets:
             return None
 
         else:
-            packet = self.packets[self.packets_index]
+            packet = self.getPacket(self.packets_index)
             self.packets_index = self.packets_index + 1
             return packet
 
@@ -430,14 +936,28 @@ class Flow:
         :param packet: The data packet for which to generate an ACK packet.
         :type packet: Packet
         """
-        start_time = packet.start_time
-        total_delay = packet.total_delay
-        newPacket = DataPacket(packet.index, packet.dest, packet.src, "ACK", constants.ACK_SIZE,
-                               packet.packetID, None, flow = self)
-        newPacket.start_time = start_time
+        if self.ackPool:
+            newPacket = self.ackPool.pop()
+            newPacket.__init__(packet.index, packet.dest, packet.src, "ACK", constants.ACK_SIZE,
+                               None, flow = self)
+        else:
+            newPacket = DataPacket(packet.index, packet.dest, packet.src, "ACK", constants.ACK_SIZE,
+                                   None, flow = self)
+        newPacket.start_time = packet.start_time
         newPacket.total_delay = packet.total_delay
         return newPacket
 
+    def releaseAckPacket(self, packet):
+        """ Returns an ACK packet that is no longer referenced by any event
+        or buffer to the pool, so generateAckPacket can reuse it.
+
+        :param packet: The consumed ACK packet.
+        :type packet: DataPacket
+        """
+        packet.src = packet.dest = None
+        packet.currLink = packet.currDev = packet.nextDev = None
+        self.ackPool.append(packet)
+
     def receiveAcknowledgement(self, packet, currentTime, tcp_type):
         """ This will call TCPReno to update the window size depending on
             the ACK ID...
@@ -460,24 +980,17 @@ class Flow:
 
         # If the ACK ID matches the host's expected ACK ID, then
         # we increment the hosts expected ACK ID by one.
-        if self.packets[self.window_lower].packetID == packet.packetID:
+        if self.window_lower == packet.index:
             # Change variable to show a packet was received in TCPFast Cycle!
             self.received_packet = True
             self.last_received_packet_start_time = packet.start_time
 
             self.data_acknowledged = self.data_acknowledged + constants.DATA_SIZE
-            self.acksAcknowledged[packet.index] = True
-
+            self.acknowledge(packet.index, currentTime, packet.start_time)
 
-            while (self.acksAcknowledged[self.window_lower] == True) and \
-                  (self.window_lower != len(self.packets) - 1):
 
-                if(self.acksAcknowledged[self.window_lower] == True):
-
-                    if self.window_lower == len(self.packets) - 1:
-                        pass
-                    else:
-                        self.window_lower = self.window_lower + 1
+            # Move past every packet acknowledged so far, stopping at the last one.
+            self.window_lower = min(self.scoreboard.cumulative, self.numPackets - 1)
 
 
             self.error_counter = 0
@@ -488,15 +1001,15 @@ class Flow:
             elif tcp_type == 'FAST': # still have to update window bounds
                 self.window_upper = floor(self.window_size) + self.window_lower - 1
 
-                if(self.window_upper > len(self.packets) - 1):
-                    self.window_upper = len(self.packets) - 1
+                if(self.window_upper > self.numPackets - 1):
+                    self.window_upper = self.numPackets - 1
 
         elif self.resending == True:
 
-            if self.acksAcknowledged[packet.index] == False:
+            if not self.scoreboard[packet.index]:
                 self.received_packet = True
                 self.last_received_packet_start_time = packet.start_time
-                self.acksAcknowledged[packet.index] = True
+                self.acknowledge(packet.index, currentTime, packet.start_time)
                 self.data_acknowledged = self.data_acknowledged + constants.DATA_SIZE
                 if tcp_type == 'Reno':
                     self.TCPReno(True)
@@ -504,8 +1017,8 @@ class Flow:
         else:
             self.error_counter = self.error_counter + 1
 
-            if self.acksAcknowledged[packet.index] == False:
-                self.acksAcknowledged[packet.index] = True
+            if not self.scoreboard[packet.index]:
+                self.acknowledge(packet.index, currentTime, packet.start_time)
                 self.data_acknowledged = self.data_acknowledged + constants.DATA_SIZE
                 self.received_packet = True
                 self.last_received_packet_start_time = packet.start_time
@@ -550,15 +1063,15 @@ class Flow:
             self.window_size = self.window_size + 1
             self.window_upper = floor(self.window_size) + self.window_lower - 1
 
-            if(self.window_upper > len(self.packets) - 1):
-                self.window_upper = len(self.packets) - 1
+            if(self.window_upper > self.numPackets - 1):
+                self.window_upper = self.numPackets - 1
 
         elif boolean == True and self.slow == False:
             self.window_size = self.window_size + float(1) / float(self.window_size)
             self.window_upper = floor(self.window_size) + self.window_lower - 1
 
-            if(self.window_upper > len(self.packets) - 1):
-                self.window_upper = len(self.packets) - 1
+            if(self.window_upper > self.numPackets - 1):
+                self.window_upper = self.numPackets - 1
 
         # Else, we will halve the window size, and reset the index of the packet.
         elif boolean == False and self.slow == False:
@@ -567,8 +1080,8 @@ class Flow:
                 self.window_size = 2
             self.window_upper = floor(self.window_size) + self.window_lower - 1
 
-            if(self.window_upper > len(self.packets) - 1):
-                self.window_upper = len(self.packets) - 1
+            if(self.window_upper > self.numPackets - 1):
+                self.window_upper = self.numPackets - 1
 
         else:
             self.window_size = self.window_size / 2
@@ -581,9 +1094,10 @@ class Flow:
 
             self.slow = True
 
-            if(self.window_upper > len(self.packets) - 1):
-                self.window_upper = len(self.packets) - 1
+            if(self.window_upper > self.numPackets - 1):
+                self.window_upper = self.numPackets - 1
 
+        self.state[FLOW_WINDOW] = self.window_size
 
     def TCPFast(self, alpha):
         """ The actualRTT is calculated by subtracting event.time
@@ -599,22 +1113,38 @@ class Flow:
 
         newWindowSize = (self.minRTT/self.actualRTT) * self.window_size + alpha
         self.window_size = newWindowSize
+        self.state[FLOW_WINDOW] = self.window_size
 
         self.window_upper = floor(self.window_size) + self.window_lower - 1
 
-        if(self.window_upper > len(self.packets) - 1):
-            self.window_upper = len(self.packets) - 1
+        if(self.window_upper > self.numPackets - 1):
+            self.window_upper = self.numPackets - 1
 
     def getWindowSize(self):
         """ Returns the current window size.
         """
         return self.window_size
 
+    def recordDelay(self, delay):
+        """ Records the RTT of a packet that was just acknowledged.
+
+        :param delay: The RTT, in ms.
+        :type delay: float
+        """
+        self.packet_delay = delay
+        self.delaySum += delay
+        self.delayCount += 1
+        state = self.state
+        state[FLOW_DELAY] = delay
+        state[FLOW_DELAY_SUM] = self.delaySum
+        state[FLOW_DELAY_COUNT] = self.delayCount
+
     def timeOut(self):
         """ A time out event. This resets the window size to 1,
         and slow threshold back to its initial value.
         """
         self.window_size = 1
+        self.state[FLOW_WINDOW] = self.window_size
         self.slowThresh = 1000000
 
 class Link:
@@ -655,6 +1185,23 @@ class Link:
         self.current_byte_size = 0 # in bytes
         self.linkBuffer = bufferQueue(buffer_size * constants.KB_TO_B)
 
+        # Packets dropped and bytes transmitted so far. They are counted
+        # here, and stored into the state table (see Flow.delaySum).
+        self.drops = 0
+        self.bytesSent = 0
+
+        # Row of the link in its Network's state table (see NetworkState).
+        self.state = np.zeros(LINK_FIELDS)
+
+        # The packet currently being serialized onto the link, or None
+        # when the transmitter is idle.
+        self.transmitting = None
+
+        # Packets propagating on the link, as (arrival time, sequence,
+        # packet, receiving device). The delay is the same for every packet,
+        # so they arrive in the order they were sent.
+        self.inFlight = collections.deque()
+
         self.device1.attachLink(self)
         self.device2.attachLink(self)
 
@@ -671,6 +1218,13 @@ class Link:
         s += "\n"
         return s
 
+    def recordDrop(self):
+        """ Records that a packet was dropped because the buffer was full.
+        """
+        self.isDropped = True
+        self.drops += 1
+        self.state[LINK_DROPS] = self.drops
+
     def droppedPacket(self):
         """ Returns if a packet has been dropped. Used for logging packet loss.
         """
@@ -700,30 +1254,65 @@ class Link:
         else:
             return self.device1
 
-    def rateFullWith(self, packet):
-        """Returns True if packet cannot be sent, False otherwise.
+    def transmissionTime(self, packet):
+        """Returns the time it takes to serialize a packet onto the link at
+        its maximum rate, in milliseconds.
 
-        :param packet: packet potentially to be sent out
+        :param packet: packet to be transmitted
         :type packet: Packet
         """
-        return (self.maxRate <= self.currentRateMbps(packet))
+        return (float(packet.data_size * constants.B_to_b) /
+                (constants.MB_TO_KB * constants.KB_TO_B) /
+                self.maxRate * constants.s_to_ms)
+
+    def startTransmission(self):
+        """Takes the next packet out of the buffer and starts transmitting it.
+        The link is busy until finishTransmission is called. Returns the packet.
+        """
+        packet = self.linkBuffer.get()
+        self.state[LINK_OCCUPANCY] = self.linkBuffer.occupancy
+        self.transmitting = packet
+        return packet
 
-    def sendPacket(self):
-        """Sends next packet in buffer queue corresponding to device along link.
-        Returns packet if success, else None.
-        Should only fail when there the link is at its maximum capacity.
+    def finishTransmission(self):
+        """The packet being transmitted has been fully serialized onto the
+        link, and starts propagating to the other device. The link is idle
+        again. Returns the packet.
+        """
+        packet = self.transmitting
+        self.transmitting = None
+        self.incrRate(packet)
+        self.bytesSent += packet.data_size
+        self.state[LINK_BYTES_SENT] = self.bytesSent
+        return packet
 
-        :param device: device packet should be sent to
-        :type device: Device
+    def propagate(self, packet, arrival, sequence):
+        """Adds a packet to the tail of the in-flight FIFO. Returns True if
+        it is the only packet in flight, i.e. its arrival must be scheduled.
+
+        :param packet: The packet that was just transmitted.
+        :type packet: Packet
+
+        :param arrival: When the packet reaches the other device, in ms.
+        :type arrival: float
 
+        :param sequence: Scheduler sequence number reserved for the arrival.
+        :type sequence: int
         """
-        packet = self.linkBuffer.peek()
-        if(not self.rateFullWith(packet)):
-            self.linkBuffer.get()
-            self.incrRate(packet)
-            return packet
-        else:
-            return None
+        self.inFlight.append((arrival, sequence, packet, packet.nextDev))
+        return len(self.inFlight) == 1
+
+    def nextArrival(self):
+        """Returns the (arrival time, sequence, packet, device) entry of the
+        next packet to arrive, without removing it.
+        """
+        return self.inFlight[0]
+
+    def arrive(self):
+        """Removes and returns the (arrival time, sequence, packet, device)
+        entry of the next packet to arrive.
+        """
+        return self.inFlight.popleft()
 
     def putIntoBuffer(self, packet):
         """Puts packet into buffer.
@@ -733,6 +1322,7 @@ class Link:
         """
 
         self.linkBuffer.put(packet)
+        self.state[LINK_OCCUPANCY] = self.linkBuffer.occupancy
 
 
     def decrRate(self, packet):
@@ -742,6 +1332,7 @@ class Link:
         :type packet : Packet"""
         if self.current_byte_size - packet.data_size >= 0:
             self.current_byte_size -= packet.data_size
+            self.state[LINK_IN_FLIGHT] = self.current_byte_size
 
     def incrRate(self, packet):
         """Increase current rate by packet size.
@@ -750,11 +1341,15 @@ class Link:
         :type packet : Packet
         """
         self.current_byte_size += packet.data_size
+        self.state[LINK_IN_FLIGHT] = self.current_byte_size
 
     def currentRateMbps(self, packet):
         """Gets the link rate, in Mbps, if a packet were added.
         Used for logging. If the packet argument
         isn't specified, then it just returns the current rate.
+        current_byte_size counts the bytes propagating on the link, which
+        were serialized at maxRate, so this is the exact throughput
+        over the last link delay.
         :param packet: Packet to be sent using this link
         :type packet: Packet
         """
@@ -772,14 +1367,14 @@ class Link:
 class Packet(object):
     """Contains information about the data being sent from one point to another."""
 
-    def __init__(self, src, dest, data_type, data_size, packetID, curr_loc):
-        """ Instatiates a Packet.
-
-        :param packetID: ID of the packet.
-        :type packetID: string
+    # A packet is allocated for every segment in flight, so packets use
+    # __slots__ instead of a per-instance dict.
+    __slots__ = ('src', 'dest', 'data_type', 'data_size',
+                 'currLink', 'currDev', 'nextDev', 'start_time', 'total_delay',
+                 'time', 'flow')
 
-        :param index: The packet (in #) that was sent by flow.
-        :type index: int
+    def __init__(self, src, dest, data_type, data_size, curr_loc):
+        """ Instatiates a Packet.
 
         :param src: Source (device) of packet
         :type src: Device
@@ -798,19 +1393,19 @@ class Packet(object):
 
         :param time: time when the packet is created.
         We refer to 'creation time' as when the packet is selected
-        from a list of initialized packets, i.e., the result of selectDataPacket().
+        by the flow, i.e., the result of selectDataPacket().
         :type time: float
         """
         self.src = src
         self.dest = dest
         self.data_type = data_type # ROUT, ACK, DATA
         self.data_size = data_size
-        self.packetID = packetID
         self.currLink = curr_loc
         self.currDev = None
         self.nextDev = None
         self.start_time = 0
         self.total_delay = 0
+        self.time = 0
 
         self.flow = None
 
@@ -822,37 +1417,61 @@ class Packet(object):
         """
         self.currLink = newLoc
 
-    def recallFlowID(self):
-        return str(self.packetID)[:2]
 
 
 class DataPacket(Packet):
     """ Captures both acknowledgement packets and actual data packets, differentiated from routing packets."""
 
-    def __init__(self, index, src, dest, data_type, data_size, packetID, curr_loc, flow):
+    __slots__ = ('index', 'destIndex')
+
+    def __init__(self, index, src, dest, data_type, data_size, curr_loc, flow):
         """ Instatiates a data Packet, which is either type ACK or DATA.
         This calls the superclass Packet initialization, using the given parameters.
+
+        :param index: Sequence number of the packet in its flow.
+        :type index: int
+
+        :param flow: The flow the packet belongs to.
+        :type flow: Flow
         """
-        super(DataPacket, self).__init__(src, dest, data_type, data_size, packetID, curr_loc)
+        super(DataPacket, self).__init__(src, dest, data_type, data_size, curr_loc)
         self.index = index
         self.flow = flow
+        self.destIndex = dest.deviceIndex
+
+    def __str__(self):
+        return self.flow.packetName(self.index)
 
 class RoutingPacket(Packet):
     """ Packets that store information about routing."""
 
-    def __init__(self, src, dest, link, data_size, table, packetID, curr_loc, latency = None):
+    __slots__ = ('latency', 'table', 'link', 'version')
+
+    def __init__(self, src, dest, link, data_size, table, curr_loc, latency = None,
+            version = None):
         """ Instantiates a Routing packet. This calls the superclass Packet initialization,
         using the given parameters.
 
+        :param table: Entries of the sender's routing table. The dict must
+            not be changed once the packet is created.
+        :type table: dict
+
         :param latency: the latency of a routing packet. By default, this is not iniitialized.
         :tyep latency: float
+
+        :param version: Version of the sender's table the entries are from.
+        :type version: int
         """
-        super(RoutingPacket, self).__init__(src, dest, "ROUT", constants.ROUTING_SIZE, packetID, curr_loc)
+        super(RoutingPacket, self).__init__(src, dest, "ROUT", constants.ROUTING_SIZE, curr_loc)
         if(latency):
             self.latency = latency
         else:
             self.latency = link.delay
         self.table = table
+        self.version = version
 
         # RoutingPackets only travel across one link before "dying"
         self.link = link
+
+    def __str__(self):
+        return str(self.src.deviceID) + " ROUT"
@@ -43,3 +43,8 @@ ROUTING_INF = 100000
 
 # How often we use dynamic routing. Every 5 seconds
 REROUT_TIME = 5000
+
+# With incremental routing, a link's cost only counts as changed (and the
+# routes through it recomputed) once it differs from the cost last used
+# for routing by more than this fraction.
+REROUT_THRESHOLD = 0.2
@@ -0,0 +1,17 @@
+# Event types. These index Simulator.handlers, so they are small
+# consecutive integers; EVENT_NAMES gives their names for verbose output.
+INITIALIZEFLOW = 0
+REROUT = 1
+UPDATEWINDOW = 2
+PUT = 3
+TXCOMPLETE = 4
+RECEIVE = 5
+GENERATEACK = 6
+SELECTPACK = 7
+RESEND = 8
+TIMEOUT = 9
+SAMPLE = 10
+
+EVENT_NAMES = ["INITIALIZEFLOW", "REROUT", "UPDATEWINDOW", "PUT", "TXCOMPLETE",
+               "RECEIVE", "GENERATEACK", "SELECTPACK", "RESEND", "TIMEOUT",
+               "SAMPLE"]
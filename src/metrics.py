@@ -1,11 +1,323 @@
 import matplotlib.pyplot as plt
+import array
 import constants
+import json
 import numpy as np
 import os
+import sys
+
+# Metric files hold (time, value) records of two little-endian float64,
+# appended one after the other with no header.
+RECORD_DTYPE = np.dtype([('time', '<f8'), ('value', '<f8')])
+
+# Number of records buffered by a MetricSeries before writing them.
+SERIES_BUFFER_RECORDS = 4096
+
+# Number of spooled records a MultiplexedSink sorts into blocks at once
+# when it is closed.
+SPOOL_CHUNK_RECORDS = 65536
+
+# Where Metrics can write the data (see Metrics.__init__).
+SINKS = ['files', 'multiplexed']
+
+
+class MetricSeries:
+    """An append-only file of (time, value) records for one metric of one
+    link or flow. Records are buffered, and written in blocks."""
+
+    def __init__(self, name):
+        """ Creates the file, or empties it.
+
+        :param name: Path of the file.
+        :type name: str
+        """
+        self.name = name
+        self.file = open(name, 'wb')
+        self.buffer = array.array('d')
+
+    def write(self, time, value):
+        """ Appends a record.
+
+        :param time: When the value was recorded (in s)
+        :type time: float
+
+        :param value: The value of the metric
+        :type value: float
+        """
+        self.buffer.append(time)
+        self.buffer.append(value)
+        if len(self.buffer) >= 2 * SERIES_BUFFER_RECORDS:
+            self.flush()
+
+    def flush(self):
+        """ Writes the buffered records to the file.
+        """
+        if sys.byteorder != 'little':
+            self.buffer.byteswap()
+        self.buffer.tofile(self.file)
+        self.buffer = array.array('d')
+
+    def close(self):
+        """ Writes the buffered records, and closes the file.
+        """
+        self.flush()
+        self.file.close()
+
+    def read(self):
+        """ Returns the times and values of the series, as two arrays.
+        """
+        return readSeries(self.name)
+
+
+def readSeries(name):
+    """ Returns the times and values of a metric file, as two arrays. The
+    file is memory-mapped rather than read, so the arrays are views into
+    it.
+
+    :param name: Path of the file.
+    :type name: str
+    """
+    records = mapRecords(name)
+    return records['time'], records['value']
+
+
+def mapRecords(name):
+    """ Returns the (time, value) records of a file, memory-mapped.
+
+    :param name: Path of the file.
+    :type name: str
+    """
+    if os.path.getsize(name) == 0:
+        # An empty file cannot be memory-mapped.
+        return np.zeros(0, dtype = RECORD_DTYPE)
+    return np.memmap(name, dtype = RECORD_DTYPE, mode = 'r')
+
+
+# Records spooled by a MultiplexedSink while the simulation runs: the
+# series (index of a link or flow in the sink), the metric of that series
+# (0, 1 or 2, as in Metrics.logMetric), the time and the value, all
+# little-endian.
+MULTIPLEXED_DTYPE = np.dtype([('series', '<i4'), ('metric', '<i4'),
+        ('time', '<f8'), ('value', '<f8')])
+
+
+class MultiplexedSink:
+    """A single file holding the records of every metric of every link and
+    flow, so that tracking thousands of them does not take thousands of
+    files.
+
+    While the simulation runs, records are buffered and appended, in the
+    order they come, to a spool file (name + '.records'). When the sink is
+    closed, they are moved into the file itself, one chunk of the spool
+    at a time: one block of (time, value) records per metric of each
+    series, in the format of a MetricSeries file. The sink then writes an index next to the file
+    (name + '.index'): a JSON object listing the series IDs in order, and
+    the offset and number of records of each metric of each series, so a
+    single series can be sliced out of the memory-mapped file."""
+
+    def __init__(self, name, seriesIDs):
+        """ Creates the spool file, or empties it.
+
+        :param name: Path of the file.
+        :type name: str
+
+        :param seriesIDs: The linkIDs and flowIDs to be logged.
+        :type seriesIDs: list<str>
+        """
+        self.name = name
+        self.spool = name + '.records'
+        self.file = open(self.spool, 'wb')
+        self.seriesIDs = list(seriesIDs)
+        self.seriesIndex = dict((ID, series) for series, ID in enumerate(self.seriesIDs))
+        self.counts = [[0, 0, 0] for ID in self.seriesIDs]
+        self.offsets = None
+        self.clearBuffer()
+
+        # The closed file, memory-mapped on the first read.
+        self.records = None
+
+    def clearBuffer(self):
+        """ Starts new, empty, buffers: one per column of the records.
+        """
+        self.series = array.array('i')
+        self.metrics = array.array('i')
+        self.times = array.array('d')
+        self.values = array.array('d')
+
+    def write(self, series, metric, time, value):
+        """ Appends a record.
+
+        :param series: Index of the link or flow in seriesIDs.
+        :type series: int
+
+        :param metric: Which metric of the link or flow.
+        :type metric: int
+
+        :param time: When the value was recorded (in s)
+        :type time: float
+
+        :param value: The value of the metric
+        :type value: float
+        """
+        self.series.append(series)
+        self.metrics.append(metric)
+        self.times.append(time)
+        self.values.append(value)
+        self.counts[series][metric] += 1
+        if len(self.times) >= SERIES_BUFFER_RECORDS:
+            self.flush()
+
+    def flush(self):
+        """ Appends the buffered records to the spool file.
+        """
+        records = np.empty(len(self.times), dtype = MULTIPLEXED_DTYPE)
+        records['series'] = self.series
+        records['metric'] = self.metrics
+        records['time'] = self.times
+        records['value'] = self.values
+        records.tofile(self.file)
+        self.clearBuffer()
+
+    def close(self):
+        """ Writes the buffered records, moves the spooled records into
+        one block per metric of each series, and writes the index.
+        """
+        self.flush()
+        self.file.close()
+
+        self.offsets = []
+        start = 0
+        for counts in self.counts:
+            self.offsets.append([])
+            for count in counts:
+                self.offsets[-1].append(start)
+                start = start + count
+        self.writeBlocks(start)
+        os.remove(self.spool)
+
+        with open(self.name + '.index', 'w') as index:
+            json.dump({'series': self.seriesIDs, 'offsets': self.offsets,
+                    'counts': self.counts}, index)
+
+    def writeBlocks(self, total):
+        """ Writes the spooled records to the file, in blocks. The offset
+        of every block is known from the counts, so the spool is read one
+        chunk of SPOOL_CHUNK_RECORDS at a time, and the records of each
+        block in the chunk are written straight to their place: memory use
+        does not grow with the number of records.
+
+        :param total: Number of spooled records.
+        :type total: int
+        """
+        # Where the next record of each metric of each series goes, by
+        # series * 3 + metric.
+        nextRecord = np.array(self.offsets, dtype = np.int64).reshape(-1)
+
+        with open(self.spool, 'rb') as spool, open(self.name, 'wb') as blocks:
+            blocks.truncate(total * RECORD_DTYPE.itemsize)
+            while True:
+                chunk = np.fromfile(spool, dtype = MULTIPLEXED_DTYPE,
+                        count = SPOOL_CHUNK_RECORDS)
+                if len(chunk) == 0:
+                    break
+
+                # A stable sort groups the chunk's records by series and
+                # metric, and keeps each group in time order.
+                keys = chunk['series'].astype(np.int64) * 3 + chunk['metric']
+                order = np.argsort(keys, kind = 'mergesort')
+                records = np.empty(len(chunk), dtype = RECORD_DTYPE)
+                records['time'] = chunk['time'][order]
+                records['value'] = chunk['value'][order]
+                groups, first, counts = np.unique(keys[order], return_index = True,
+                        return_counts = True)
+
+                for group, start, count in zip(groups, first, counts):
+                    blocks.seek(nextRecord[group] * RECORD_DTYPE.itemsize)
+                    records[start:start + count].tofile(blocks)
+                nextRecord[groups] += counts
+
+    def read(self, series, metric):
+        """ Returns the times and values of one metric of one series of
+        the closed file, as two arrays (views into the memory-mapped file).
+
+        :param series: Index of the link or flow in seriesIDs.
+        :type series: int
+
+        :param metric: Which metric of the link or flow.
+        :type metric: int
+        """
+        if self.records is None:
+            self.records = mapRecords(self.name)
+        start = self.offsets[series][metric]
+        records = self.records[start:start + self.counts[series][metric]]
+        return records['time'], records['value']
+
+
+class SinkChannel:
+    """One metric of one link or flow, written to a MultiplexedSink. It is
+    used like a MetricSeries."""
+
+    def __init__(self, sink, series, metric):
+        """
+        :param sink: The sink records are written to.
+        :type sink: MultiplexedSink
+
+        :param series: Index of the link or flow in the sink.
+        :type series: int
+
+        :param metric: Which metric of the link or flow.
+        :type metric: int
+        """
+        self.sink = sink
+        self.series = series
+        self.metric = metric
+
+    def write(self, time, value):
+        """ Appends a record.
+
+        :param time: When the value was recorded (in s)
+        :type time: float
+
+        :param value: The value of the metric
+        :type value: float
+        """
+        self.sink.write(self.series, self.metric, time, value)
+
+    def close(self):
+        """ The sink is closed by its owner.
+        """
+        pass
+
+    def read(self):
+        """ Returns the times and values of the series, as two arrays.
+        """
+        return self.sink.read(self.series, self.metric)
+
+
+def readMultiplexed(name, ID, metric):
+    """ Returns the times and values of one metric of one link or flow
+    from a closed multiplexed metrics file, as two arrays. Only the
+    index is read: the records are sliced out of the memory-mapped file.
+
+    :param name: Path of the file.
+    :type name: str
+
+    :param ID: The linkID or flowID.
+    :type ID: str
+
+    :param metric: Which metric of the link or flow.
+    :type metric: int
+    """
+    with open(name + '.index') as index:
+        index = json.load(index)
+    series = index['series'].index(ID)
+    start = index['offsets'][series][metric]
+    records = mapRecords(name)[start:start + index['counts'][series][metric]]
+    return records['time'], records['value']
 
 
 class Metrics:
-    def __init__(self, log, flows, links):
+    def __init__(self, log, flows, links, sink = 'files'):
         """Logs the metrics. The simulation calls this whenever
         it wishes to record some data for a particular link, or flow.
         Currently, both links and flows have three (exclusive) metrics:
@@ -20,6 +332,8 @@ class Metrics:
             if 'avg': data is to be collected over LOG_TIME_INTERVAL,
             and then averaged for that time interval
             if 'more': data is to be logged whenever relevant
+            With 'less' and 'avg', the simulator samples the data once
+            per LOG_TIME_INTERVAL and logs it with logSample.
         :type log: str
 
         :param flows: the flows that are to be tracked (if any)
@@ -27,6 +341,12 @@ class Metrics:
 
         :param links: the links that are to be tracked (if any)
         :type links: list<str>
+
+        :param sink: Where the data is written (one of SINKS).
+            if 'files': each metric of each link/flow has its own file.
+            if 'multiplexed': every metric of every link/flow is
+            written to metrics/metrics.bin (see MultiplexedSink).
+        :type sink: str
         """
 
         if(not os.path.isdir("metrics")):
@@ -36,6 +356,9 @@ class Metrics:
         self.links = links
         self.flows = flows
 
+        # Links and flows can have any ID, so tell them apart with a set.
+        self.linkIDs = set(str(link) for link in links)
+
         # for each metric we wish to measure (link rate, flow rate, etc),
         # give indices denoting the current time interval's
         # lower bound [0] and upper bound [1]
@@ -47,6 +370,11 @@ class Metrics:
                 [0, constants.LOG_TIME_INTERVAL, 0, 0]
         ]
 
+        self.sink = None
+        if sink == 'multiplexed':
+            self.sink = MultiplexedSink('metrics/metrics.bin',
+                    [str(link) for link in links] + [str(flow) for flow in flows])
+
         # container containing relevant for all the links/flows AS we log
         self.logData = {}
         # container containing information for all the links/flows we have 
@@ -58,18 +386,31 @@ class Metrics:
                 [0, constants.LOG_TIME_INTERVAL, 0, 0],
                 [0, constants.LOG_TIME_INTERVAL, 0, 0]
             ]
-            self.totalData[str(link)] = [open('metrics/' + str(link) + '_linkRate.log', 'w'),
-                    open('metrics/' + str(link) + '_bufferOccupancy.log', 'w'),
-                    open('metrics/' + str(link) + '_packetLoss.log', 'w')]
+            self.totalData[str(link)] = self.openSeries(str(link),
+                    ['linkRate', 'bufferOccupancy', 'packetLoss'])
         for flow in flows:
             self.logData[str(flow)] = [
                 [0, constants.LOG_TIME_INTERVAL, 0, 0],
                 [0, constants.LOG_TIME_INTERVAL, 0, 0],
                 [0, constants.LOG_TIME_INTERVAL, 0, 0]
             ]
-            self.totalData[str(flow)] = [open('metrics/' + str(flow) + '_flowRate.log', 'w'),
-                    open('metrics/' + str(flow) + '_windowSize.log', 'w'),
-                    open('metrics/' + str(flow) + '_packetDelay.log', 'w')]
+            self.totalData[str(flow)] = self.openSeries(str(flow),
+                    ['flowRate', 'windowSize', 'packetDelay'])
+
+    def openSeries(self, ID, names):
+        """ Returns the series the metrics of a link or flow are written
+        to: its channels of the multiplexed sink, or new files.
+
+        :param ID: the linkID, or flowID.
+        :type ID: str
+
+        :param names: the names of its three metrics.
+        :type names: list<str>
+        """
+        if self.sink is not None:
+            series = self.sink.seriesIndex[ID]
+            return [SinkChannel(self.sink, series, metric) for metric in range(3)]
+        return [MetricSeries('metrics/' + ID + '_' + name + '.bin') for name in names]
 
     def done(self):
         """ Closes the log files, Then reads them and graphs the data.
@@ -78,6 +419,8 @@ class Metrics:
             value[0].close()
             value[1].close()
             value[2].close()
+        if self.sink is not None:
+            self.sink.close()
         self.run()
 
     def logMetric(self, time, value, type, ID):
@@ -99,7 +442,7 @@ class Metrics:
         :type ID: str
         """
 
-        if str(ID) not in self.links and str(ID) not in self.flows:
+        if str(ID) not in self.totalData:
             return
         metricType = self.logData[str(ID)]
         metricFileData = self.totalData[str(ID)]
@@ -115,10 +458,9 @@ class Metrics:
                     # if this is a packet loss, don't average it. Just
                     # return the total number of packets dropped during this period
                     data = metricType[type][2]
-                    if not ('L' in ID and type == 2):
+                    if not (ID in self.linkIDs and type == 2):
                         data = metricType[type][2] / count
-                    metricFileData[type].write(str(upperTimeInterval)
-                        + " " + str(data) + "\n")
+                    metricFileData[type].write(upperTimeInterval, data)
 
 
                 # update the upper/lower bounds
@@ -145,140 +487,130 @@ class Metrics:
                 metricType[type][1] += constants.LOG_TIME_INTERVAL
                 upperTimeInterval = metricType[type][1]
             if time >= lowerTimeInterval:
-                metricFileData[type].write(str(upperTimeInterval)
-                    + " "
-                    + str(value) + "\n")
+                metricFileData[type].write(upperTimeInterval, value)
                 # update the lower bound
                 metricType[type][0] \
                     = metricType[type][1]
         else: # self.log == 'more'
-            metricFileData[type].write(str(time)
-            + " "
-            + str(value) + "\n")
+            metricFileData[type].write(time, value)
+
+    def logSample(self, time, value, type, ID):
+        """Writes the value of a metric sampled at the end of a time
+        interval to its file.
+
+        :param time: The end of the time interval (in s)
+        :type time: float
+
+        :param value: The value of the metric over the interval
+        :type value: float
+
+        :param type: A fixed constant that denotes which type of metric is
+        to be recorded
+        :type type: int
+
+        :param ID: the linkID, or flowID, for which this particular metric is logged.
+        :type ID: str
+        """
+        self.totalData[ID][type].write(time, value)
 
-    def linkRate(self, fig, ID, file, ax):
-        """Reads in the data from files for link rate, and then plots it.
+    def linkRate(self, fig, ID, series, ax):
+        """Reads in the data for link rate, and then plots it.
         :param fig: the figure
         :type fig: pyplot.figure
 
         :param ID: the linkID whose data is to be plotted.
         :type ID: str
 
-        :param file: the name of the file to read from
-        :type file: str
+        :param series: the series to plot
+        :type series: MetricSeries/SinkChannel
 
         :param ax: The figure's subplot.
         :type ax: pyplot.figure.subplot
         """
 
-        try:
-            time, linkRate = np.loadtxt(file, delimiter=' ',
-                    usecols = (0, 1), unpack = True)
-        except ValueError as e:
-            print str(e) + " for link rate"
-            return
+        time, linkRate = series.read()
 
         ax.plot(time, linkRate, label=ID)
         # Put a legend to the right of the current axis
         ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
-    def bufferOccupancy(self, fig, ID, file, ax):
-        """Reads in the data from files for buffer occupancy, and then plots it.
+    def bufferOccupancy(self, fig, ID, series, ax):
+        """Reads in the data for buffer occupancy, and then plots it.
         :param fig: the figure
         :type fig: pyplot.figure
 
         :param ID: the linkID whose data is to be plotted.
         :type ID: str
 
-        :param file: the name of the file to read from
-        :type file: str
+        :param series: the series to plot
+        :type series: MetricSeries/SinkChannel
 
         :param ax: The figure's subplot.
         :type ax: pyplot.figure.subplot
         """
-        try:
-            time, buffer = np.loadtxt(file, delimiter=' ',
-                    usecols = (0, 1), unpack = True)
-        except ValueError as e:
-            print str(e) + " for buffer occupancy"
-            return
+        time, buffer = series.read()
 
         ax.plot(time, buffer, label=ID)
         # Put a legend to the right of the current axis
         ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
-    def packetLoss(self, fig, ID, file, ax):
-        """Reads in the data from files for packet loss, and then plots it.
+    def packetLoss(self, fig, ID, series, ax):
+        """Reads in the data for packet loss, and then plots it.
         :param fig: the figure
         :type fig: pyplot.figure
 
         :param ID: the linkID whose data is to be plotted.
         :type ID: str
 
-        :param file: the name of the file to read from
-        :type file: str
+        :param series: the series to plot
+        :type series: MetricSeries/SinkChannel
 
         :param ax: The figure's subplot.
         :type ax: pyplot.figure.subplot
         """
-        try:
-            time, packetLoss = np.loadtxt(file, delimiter=' ',
-                    usecols = (0, 1), unpack = True)
-        except ValueError as e:
-            print str(e) + " for packet loss"
-            return
+        time, packetLoss = series.read()
 
         ax.plot(time, packetLoss, label=ID)
 
         # Put a legend to the right of the current axis
         ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
-    def flowRate(self, fig, ID, file, ax):
-        """Reads in the data from files for flow rate, and then plots it.
+    def flowRate(self, fig, ID, series, ax):
+        """Reads in the data for flow rate, and then plots it.
         :param fig: the figure
         :type fig: pyplot.figure
 
         :param ID: the linkID whose data is to be plotted.
         :type ID: str
 
-        :param file: the name of the file to read from
-        :type file: str
+        :param series: the series to plot
+        :type series: MetricSeries/SinkChannel
 
         :param ax: The figure's subplot.
         :type ax: pyplot.figure.subplot
         """
-        try:
-            time, flowRate = np.loadtxt(file, delimiter=' ',
-                    usecols = (0, 1), unpack = True)
-        except ValueError as e:
-            print str(e) + " for flow rate"
-            return
+        time, flowRate = series.read()
 
         ax.plot(time, flowRate, label=ID)
 
         # Put a legend to the right of the current axis
         ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
-    def windowSize(self, fig, ID, file, ax):
-        """Reads in the data from files for window size, and then plots it.
+    def windowSize(self, fig, ID, series, ax):
+        """Reads in the data for window size, and then plots it.
         :param fig: the figure
         :type fig: pyplot.figure
 
         :param ID: the linkID whose data is to be plotted.
         :type ID: str
 
-        :param file: the name of the file to read from
-        :type file: str
+        :param series: the series to plot
+        :type series: MetricSeries/SinkChannel
 
         :param ax: The figure's subplot.
         :type ax: pyplot.figure.subplot
         """
-        try:
-            time, windowSize = np.loadtxt(file, delimiter=' ',
-                    usecols = (0, 1), unpack = True)
-        except ValueError as e:
-            print str(e) + " for window size"
-            return
+        time, windowSize = series.read()
 
         ax.plot(time, windowSize, label=ID)
 
@@ -286,26 +618,21 @@ class Metrics:
         ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
 
-    def packetDelay(self, fig, ID, file, ax):
-        """Reads in the data from files for packet delay, and then plots it.
+    def packetDelay(self, fig, ID, series, ax):
+        """Reads in the data for packet delay, and then plots it.
         :param fig: the figure
         :type fig: pyplot.figure
 
         :param ID: the linkID whose data is to be plotted.
         :type ID: str
 
-        :param file: the name of the file to read from
-        :type file: str
+        :param series: the series to plot
+        :type series: MetricSeries/SinkChannel
 
         :param ax: The figure's subplot.
         :type ax: pyplot.figure.subplot
         """
-        try:
-            time, packetDelay = np.loadtxt(file, delimiter=' ',
-                    usecols = (0, 1), unpack = True)
-        except ValueError as e:
-            print str(e) + " for packet delay"
-            return
+        time, packetDelay = series.read()
 
 
         ax.plot(time, packetDelay, label=ID)
@@ -370,14 +697,14 @@ class Metrics:
 
 
         for key, value in self.totalData.iteritems():
-            if "L" in key:
-                self.linkRate(fig, key, value[0].name, ax1)
-                self.bufferOccupancy(fig, key, value[1].name, ax2)
-                self.packetLoss(fig, key, value[2].name, ax3)
-            elif "F" in key:
-                self.flowRate(fig2, key, value[0].name, ax4)
-                self.windowSize(fig2, key, value[1].name, ax5)
-                self.packetDelay(fig2, key, value[2].name, ax6)
+            if key in self.linkIDs:
+                self.linkRate(fig, key, value[0], ax1)
+                self.bufferOccupancy(fig, key, value[1], ax2)
+                self.packetLoss(fig, key, value[2], ax3)
+            else:
+                self.flowRate(fig2, key, value[0], ax4)
+                self.windowSize(fig2, key, value[1], ax5)
+                self.packetDelay(fig2, key, value[2], ax6)
         fig.subplots_adjust(left = 0.08, right = 0.87, hspace = 0.78)
         fig2.subplots_adjust(left = 0.08, right = 0.87, hspace = 0.78)
 
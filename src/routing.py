@@ -0,0 +1,221 @@
+import heapq
+import itertools
+import constants
+from classes import Host, Router
+
+# Routing modes selectable from the command line.
+#   flood: routers flood their tables to each other in RoutingPackets, as
+#          in a distance-vector protocol.
+#   spf: every routing table is computed directly from the network graph,
+#        with Dijkstra's shortest path first algorithm.
+#   incremental: like spf, but dynamic routing ignores small changes of
+#        the link costs, and only recomputes (in full) the tables of routers
+#        whose shortest paths are affected by the others (see
+#        IncrementalRouting).
+ROUTING_MODES = ['flood', 'spf', 'incremental']
+
+
+def staticWeight(link):
+    """ The cost of a link for static routing: its propagation delay.
+
+    :param link: The link to weigh.
+    :type link: Link
+    """
+    return link.delay
+
+
+def dynamicWeight(link):
+    """ The cost of a link for dynamic routing: its propagation delay plus
+    the delay of the packets in its buffer.
+
+    :param link: The link to weigh.
+    :type link: Link
+    """
+    return link.calcExpectedLatency()
+
+
+def shortestPaths(source, weight, treeLinks = None):
+    """ Runs Dijkstra's algorithm from a router. Returns its routing table,
+    in the same format as Router.rout_table: a dictionary from each
+    reachable device to (distance, first link on the path to it).
+
+    Hosts are leaves: as with flooding, paths never go through a host.
+
+    :param source: The router whose table is computed.
+    :type source: Router
+
+    :param weight: Gives the cost of a link.
+    :type weight: function
+
+    :param treeLinks: If given, the links of the shortest path tree are
+        added to this set.
+    :type treeLinks: set<Link>
+    """
+    table = {}
+    best = {source: 0}
+
+    # Entries are (distance, insertion order, device, first link, last
+    # link), so ties are broken by insertion order rather than by
+    # comparing devices.
+    counter = itertools.count()
+    heap = [(0, next(counter), source, None, None)]
+    while heap:
+        dist, order, device, firstLink, lastLink = heapq.heappop(heap)
+        if device in table:
+            continue
+        table[device] = (dist, firstLink)
+        if treeLinks is not None and lastLink is not None:
+            treeLinks.add(lastLink)
+
+        if isinstance(device, Host) and device is not source:
+            continue
+        for link in device.links:
+            otherDev = link.otherDevice(device)
+            if otherDev in table:
+                continue
+            newDist = dist + weight(link)
+            if otherDev not in best or newDist < best[otherDev]:
+                best[otherDev] = newDist
+                heapq.heappush(heap, (newDist, next(counter), otherDev,
+                            link if firstLink is None else firstLink, link))
+    return table
+
+
+def computeRoutingTables(network, weight):
+    """ Fills the routing table of every router in the network in a single
+    pass, without sending any RoutingPackets.
+
+    :param network: The network to route.
+    :type network: Network
+
+    :param weight: Gives the cost of a link.
+    :type weight: function
+    """
+    for deviceID in network.devices:
+        device = network.devices[deviceID]
+        if isinstance(device, Router):
+            device.setRoutingTable(shortestPaths(device, weight))
+
+
+class IncrementalRouting:
+    """Keeps the routing tables up to date as link costs change, only
+    recomputing the tables that can be affected by the change. This is SPF
+    with hysteresis, not a dynamic shortest path algorithm.
+
+    The cost of each link is remembered as it was when the tables were
+    computed. A link only counts as changed once its current cost differs
+    from that by more than a threshold (a fraction of the old cost), so
+    small fluctuations of the buffers do not trigger any work. For each
+    changed link, a router's table is recomputed if:
+
+        * the link's cost went up, and the link is in the router's
+          shortest path tree;
+        * the link's cost went down, and it now gives a shorter path to
+          the device at one of its ends.
+
+    Each update still weighs every link to find the changed ones, and an
+    affected table is recomputed with a full run of Dijkstra's algorithm.
+    The saving over spf is in the tables left alone: none when no link
+    changed beyond the threshold, but a change in the core of the network
+    can cost as much as spf.
+    """
+
+    def __init__(self, network, threshold = constants.REROUT_THRESHOLD):
+        """ Computes every routing table from the current link costs.
+
+        :param network: The network to route.
+        :type network: Network
+
+        :param threshold: Relative change of a link's cost needed before
+            the routes through it are recomputed.
+        :type threshold: float
+        """
+        self.network = network
+        self.threshold = threshold
+
+        self.routers = [network.devices[deviceID] for deviceID in sorted(network.devices)
+                        if isinstance(network.devices[deviceID], Router)]
+
+        # Link costs the current tables were computed with.
+        self.costs = {}
+        for linkID in network.links:
+            link = network.links[linkID]
+            self.costs[link] = dynamicWeight(link)
+
+        # Links of each router's shortest path tree.
+        self.trees = {}
+        for router in self.routers:
+            self.recompute(router)
+
+    def recompute(self, router):
+        """ Recomputes the routing table of a router, with the remembered
+        link costs.
+
+        :param router: The router to recompute.
+        :type router: Router
+        """
+        tree = set()
+        router.setRoutingTable(shortestPaths(router, self.costs.__getitem__, tree))
+        self.trees[router] = tree
+
+    def changedLinks(self):
+        """ Returns the links whose cost changed by more than the
+        threshold, with their new cost, as a dict.
+        """
+        changed = {}
+        for linkID in self.network.links:
+            link = self.network.links[linkID]
+            old = self.costs[link]
+            new = dynamicWeight(link)
+            if abs(new - old) > self.threshold * old:
+                changed[link] = new
+        return changed
+
+    def improves(self, router, link, cost):
+        """ Returns True if the link, at the given cost, gives the router a
+        shorter path to the device at either of its ends.
+
+        :param router: The router whose table is checked.
+        :type router: Router
+
+        :param link: A link whose cost went down.
+        :type link: Link
+
+        :param cost: The new cost of the link.
+        :type cost: float
+        """
+        table = router.rout_table
+        for (near, far) in ((link.device1, link.device2), (link.device2, link.device1)):
+            if near not in table:
+                continue
+            if isinstance(near, Host) and near is not router:
+                continue
+            if far not in table or table[near][0] + cost < table[far][0]:
+                return True
+        return False
+
+    def update(self):
+        """ Applies the link cost changes beyond the threshold, and
+        recomputes the affected routing tables. Returns the number of
+        links changed and of tables recomputed.
+        """
+        changed = self.changedLinks()
+        if not changed:
+            return 0, 0
+
+        affected = []
+        for router in self.routers:
+            for link in changed:
+                cost = changed[link]
+                if cost > self.costs[link]:
+                    if link in self.trees[router]:
+                        affected.append(router)
+                        break
+                elif self.improves(router, link, cost):
+                    affected.append(router)
+                    break
+
+        self.costs.update(changed)
+        for router in affected:
+            self.recompute(router)
+        return len(changed), len(affected)
@@ -1,10 +1,117 @@
 import argparse
+import fnmatch
 import json
 import pprint
 import classes
 import constants
+import scheduler
 import simulation
+import tracing
 import metrics as m
+import routing
+
+
+def buildNetwork(parsed_data, quiet = False):
+    """ Builds the devices, links and flows described by the parsed json
+    data, and returns the Network made up of them.
+
+    :param parsed_data: The network description loaded from a json file.
+    :type parsed_data: dict
+
+    :param quiet: If True, does not print the network as it is parsed.
+    :type quiet: bool
+    """
+    devices = {}
+    links = {}
+    flows = {}
+
+    # Parse json data into data structures
+    if not quiet:
+        print "\n\n"
+        print "Iterating over hosts:"
+    for host_name in parsed_data['hosts']:
+        if not quiet:
+            print "Host ", host_name, "has data: ", parsed_data['hosts'][host_name]
+        host = classes.Host(str(host_name))
+        devices[str(host_name)] = host
+
+    if not quiet:
+        print "Iterating over routers:"
+    for router_name in parsed_data['routers']:
+        if not quiet:
+            print "Router ", router_name, "has data: ", parsed_data['routers'][router_name]
+        router = classes.Router(str(router_name))
+        devices[str(router_name)] = router
+    if not quiet:
+        print "Hosts and routers instantiated. ", "\n\n"
+        print "Iterating over links and adding to hosts/routers:"
+    for link_name in parsed_data['links']:
+        link_data = parsed_data['links'][link_name]
+        if not quiet:
+            print "Link ", link_name, "has data: ", link_data
+
+        link = classes.Link(str(link_name), link_data['link_rate'], link_data['link_delay'],
+                            link_data['link_buffer'],
+                            devices[link_data['devices'][0]], devices[link_data['devices'][1]])
+        links[str(link_name)] = link
+    if not quiet:
+        print "Links instantiated.", "\n\n"
+        print "Iterating over flows:"
+    for flow_name in parsed_data['flows']:
+        flow_data = parsed_data['flows'][flow_name]
+        if not quiet:
+            print "Flow ", flow_name, "has data: ", flow_data
+
+        flow = classes.Flow(str(flow_name), devices[flow_data['flow_src']],
+                            devices[flow_data['flow_dest']],
+                            flow_data['data_amt'], flow_data['flow_start'], flow_data['theoRTT'])
+        flows[str(flow_name)] = flow
+    if not quiet:
+        print "Flows instantiated.", "\n\n"
+
+    return classes.Network(devices, links, flows)
+
+
+def selectIDs(patterns, IDs):
+    """ Returns the IDs matching any of the patterns, in sorted order, or
+    None if a pattern matches nothing. 'all' matches every ID; other
+    patterns may use shell-style wildcards ('F*', 'L1?').
+
+    :param patterns: The patterns given on the command line.
+    :type patterns: list<str>
+
+    :param IDs: The linkIDs or flowIDs of the network.
+    :type IDs: list<str>
+    """
+    selected = set()
+    for pattern in patterns:
+        if pattern == 'all':
+            pattern = '*'
+        matched = fnmatch.filter(IDs, pattern)
+        if not matched:
+            return None
+        selected.update(matched)
+    return sorted(selected)
+
+
+def startFlows(simulator):
+    """ Schedules the start of every flow in the network, the first
+    dynamic routing update, and the first metrics sample (unless the
+    metrics are logged after every event).
+
+    :param simulator: The simulator, after static routing has converged.
+    :type simulator: Simulator
+    """
+    for flow_name in simulator.network.flows:
+        flow = simulator.network.flows[flow_name]
+
+        newGenEvent = simulation.Event(None, None, simulation.INITIALIZEFLOW, flow.flow_start, flow)
+        simulator.insertEvent(newGenEvent)
+
+    simulator.schedulePeriodic(simulation.REROUT, constants.REROUT_TIME)
+
+    if simulator.metrics is not None and not simulator.logEveryEvent:
+        simulator.startSampling(0)
 
 
 def main():
@@ -54,19 +161,72 @@ def main():
             action = 'store', dest = 'links', metavar = 'LinkID',
             help = 'Specify which\
             links are to be logged. LinkID must given in the form\
-            \'L1\', \'L2\', etc. Subargument for the -m argument.')
+            \'L1\', \'L2\', etc., or be \'all\' or a wildcard pattern\
+            such as \'L1*\'. Subargument for the -m argument.')
 
     metrics.add_argument('-f', '--flows', nargs='+', type = str,
             action = 'store', dest = 'flows', metavar = 'FlowID',
             help = 'Specify which\
             flows are to be logged. FlowID must given in the form\
-            \'F1\', \'F2\', etc. Subargument for the -m argument.')
+            \'F1\', \'F2\', etc., or be \'all\' or a wildcard pattern\
+            such as \'F*\'. Subargument for the -m argument.')
+
+    metrics.add_argument('--sink', action = 'store', dest = 'sink',
+            choices = m.SINKS, default = 'files',
+            help = 'Write each metric of each link and flow to its own\
+            file, or everything to a single multiplexed file\
+            (for whole-network logging). Subargument for the -m argument.')
+
+    parser.add_argument('--scheduler', action = 'store', dest = 'scheduler',
+            choices = sorted(scheduler.SCHEDULERS), default = 'heap',
+            help = 'Which pending event set to use: a binary heap, or a\
+            calendar queue for runs with very many pending events')
+
+    parser.add_argument('--routing', action = 'store', dest = 'routing',
+            choices = routing.ROUTING_MODES, default = 'flood',
+            help = 'How routing tables are computed: by flooding routing\
+            packets between routers, or directly with Dijkstra\'s\
+            shortest path first algorithm, possibly only recomputing the\
+            tables affected by changed links')
+
+    parser.add_argument('--reroute-threshold', type = float,
+            action = 'store', dest = 'reroute_threshold',
+            default = constants.REROUT_THRESHOLD,
+            help = 'With incremental routing, relative change of a link\'s\
+            cost needed before the routes through it are recomputed')
+
+    parser.add_argument('--until', type = float,
+            action = 'store', dest = 'until', metavar = 'TIME',
+            help = 'Stop the simulation at this time, in ms, even if some\
+            flows are not complete')
+
+    parser.add_argument('--max-events', type = int,
+            action = 'store', dest = 'max_events', metavar = 'EVENTS',
+            help = 'Stop the simulation after this many events, even if\
+            some flows are not complete')
 
     parser.add_argument('-v', action = 'store_true',
             dest = 'verbose',
             help = 'verbose: prints out information about events,\
             event time, and number of elements in priority queue')
 
+    trace = parser.add_argument_group()
+    trace.add_argument('--trace-events', nargs='+', type = str,
+            action = 'store', dest = 'trace_events', metavar = 'EventType',
+            choices = simulation.EVENT_NAMES,
+            help = 'Only trace events of these types, e.g. RECEIVE TIMEOUT.\
+            Subargument for the -v argument.')
+
+    trace.add_argument('--trace-flows', nargs='+', type = str,
+            action = 'store', dest = 'trace_flows', metavar = 'FlowID',
+            help = 'Only trace events of these flows.\
+            Subargument for the -v argument.')
+
+    trace.add_argument('--trace-links', nargs='+', type = str,
+            action = 'store', dest = 'trace_links', metavar = 'LinkID',
+            help = 'Only trace events involving these links.\
+            Subargument for the -v argument.')
+
     args = parser.parse_args()
     # All subargs must be present if --m is invoked
     if not args.metrics and (args.log is not None or args.links is not None or args.flows is not None):
@@ -78,6 +238,11 @@ def main():
         parser.print_usage()
         print "Error: All of --m's subargments required."
         return
+    elif not args.verbose and (args.trace_events is not None or
+            args.trace_flows is not None or args.trace_links is not None):
+        parser.print_usage()
+        print "Error: -v argument is required."
+        return
 
 
 
@@ -88,65 +253,34 @@ def main():
         print "JSON DATA:"
         pprint.pprint(parsed_data)
 
-    devices = {}
-    links = {}
-    flows = {}
-
-    print "\n\n"
-
-    # Parse json data into data structures
-    print "Iterating over hosts:"
-    for host_name in parsed_data['hosts']:
-        print "Host ", host_name, "has data: ", parsed_data['hosts'][host_name]
-        host = classes.Host(str(host_name))
-        devices[str(host_name)] = host
-
-    print "Iterating over routers:"
-    for router_name in parsed_data['routers']:
-        print "Router ", router_name, "has data: ", parsed_data['routers'][router_name]
-        router = classes.Router(str(router_name))
-        devices[str(router_name)] = router
-    print "Hosts and routers instantiated. ", "\n\n"
-
-    print "Iterating over links and adding to hosts/routers:"
-    for link_name in parsed_data['links']:
-        link_data = parsed_data['links'][link_name]
-        print "Link ", link_name, "has data: ", link_data
-
-        link = classes.Link(str(link_name), link_data['link_rate'], link_data['link_delay'],
-                            link_data['link_buffer'],
-                            devices[link_data['devices'][0]], devices[link_data['devices'][1]])
-        links[str(link_name)] = link
-    print "Links instantiated.", "\n\n"
-
-    print "Iterating over flows:"
-    for flow_name in parsed_data['flows']:
-        flow_data = parsed_data['flows'][flow_name]
-        print "Flow ", flow_name, "has data: ", flow_data
-
-        flow = classes.Flow(str(flow_name), devices[flow_data['flow_src']],
-                            devices[flow_data['flow_dest']],
-                            flow_data['data_amt'], flow_data['flow_start'], flow_data['theoRTT'])
-        flows[str(flow_name)] = flow
-    print "Flows instantiated.", "\n\n"
+    network = buildNetwork(parsed_data)
+    links = network.links
+    flows = network.flows
+    devices = network.devices
 
 
     # Verifying metric inputs from command line are correct
     if args.metrics:
-        for flowID in args.flows:
-            if flowID not in flows.keys():
-                print "Bad flowID in argument list."
-                return
-        for linkID in args.links:
-            if linkID not in links.keys():
-                print "Bad linkID in argument list."
-                return
-
-    network = classes.Network(devices, links, flows)
+        args.flows = selectIDs(args.flows, flows.keys())
+        if args.flows is None:
+            print "Bad flowID in argument list."
+            return
+        args.links = selectIDs(args.links, links.keys())
+        if args.links is None:
+            print "Bad linkID in argument list."
+            return
+
     met = None
     if args.metrics:
-       met  = m.Metrics(args.log, args.flows, args.links)
-    simulator = simulation.Simulator(network, args.tcp_type, met)
+       met  = m.Metrics(args.log, args.flows, args.links, args.sink)
+    traceEvents = None
+    if args.trace_events is not None:
+        traceEvents = [simulation.EVENT_NAMES.index(name) for name in args.trace_events]
+    tracer = tracing.Tracer(args.verbose, traceEvents, args.trace_flows, args.trace_links)
+
+    simulator = simulation.Simulator(network, args.tcp_type, met,
+            scheduler.SCHEDULERS[args.scheduler](), tracer, args.routing,
+            args.reroute_threshold)
 
     # Generate initial routing table
     print "Running..."
@@ -154,10 +288,7 @@ def main():
         print "Static routing:"
 
     simulator.staticRouting()
-    while not simulator.q.empty():
-        result = simulator.processEvent()
-        if args.verbose:
-            print "processing one event\n" + str(result)
+    simulator.run(stop_when_flows_complete = False)
 
     if args.verbose:
         print "------------NETWORK------------"
@@ -176,27 +307,24 @@ def main():
         print "----------STARTING SIMULATION------------"
 
     # Flows begin:
-    for flow_name in flows:
-        flow = flows[flow_name]
-
-        counter = 0
-        timer = flow.flow_start
-
-        newGenEvent = simulation.Event(None, None, "INITIALIZEFLOW", timer, flow)
-        simulator.insertEvent(newGenEvent)
-
-    newDynamicRoutingEvent = simulation.Event(None, None, "REROUT", constants.REROUT_TIME, None)
-    simulator.insertEvent(newDynamicRoutingEvent)
-
-    while not simulator.q.empty():
-        result = simulator.processEvent()
-        if args.verbose:
-            print "QUEUE SIZE: " + str(simulator.q.qsize()) + "\n" + str(result)
+    startFlows(simulator)
+    result = simulator.run(until = args.until, max_events = args.max_events)
+    if args.verbose or not network.allFlowsComplete():
+        print "Stopped (" + result.reason + ") after", result.events, \
+                "events, at time", result.time, "ms"
 
     for flow_name in flows:
         flow = flows[flow_name]
         print "DATA ACKNOWLEDGED: " + str(flow.data_acknowledged)
         print "DATA MADE: " + str(flow.data_amt)
+        print "COMPLETION TIME: " + str(flow.completion_time)
+        stats = flow.statistics()
+        print "RETRANSMISSIONS: " + str(stats['retransmissions']) + \
+                " (rate " + str(stats['retransmission_rate']) + ")"
+        print "RTT (mean/median/95%/max): " + str(stats['rtt_mean']) + " / " + \
+                str(stats['rtt_median']) + " / " + str(stats['rtt_p95']) + " / " + \
+                str(stats['rtt_max'])
+        print "GOODPUT (Mbps): " + str(stats['goodput'])
 
     print "Simulation for ", args.json_file_name[:-4], args.tcp_type, args.log, " done!"
     simulator.done()
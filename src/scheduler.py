@@ -0,0 +1,461 @@
+import bisect
+import heapq
+import itertools
+
+# Priority classes used to break ties between events at the same time.
+# Events without a packet (SELECTPACK, TIMEOUT, ...) are almost
+# instantaneous, so they are processed before events carrying a packet.
+PRIORITY_NOPACKET = 0
+PRIORITY_PACKET = 1
+
+
+class HeapScheduler:
+    """A single-threaded event scheduler built on a binary heap.
+
+    Each entry on the heap is a tuple (time, priority class, sequence, event).
+    The key is computed once, when the event is inserted, so the heap only
+    ever compares floats and ints. Ties between events with the same time and
+    priority class are broken by the insertion counter, which keeps the order
+    of the simulation deterministic.
+    """
+
+    def __init__(self):
+        """ Initializes an empty scheduler.
+        """
+        self.heap = []
+        self.counter = itertools.count()
+
+    def put(self, event, sequence = None):
+        """ Inserts an event into the scheduler.
+
+        :param event: The event to schedule.
+        :type event: Event
+
+        :param sequence: A number obtained earlier from reserve(), to order
+            the event as if it had been inserted at that point.
+        :type sequence: int
+        """
+        if event.packet is None:
+            priority = PRIORITY_NOPACKET
+        else:
+            priority = PRIORITY_PACKET
+        if sequence is None:
+            sequence = next(self.counter)
+        heapq.heappush(self.heap, (event.time, priority, sequence, event))
+
+    def reserve(self):
+        """ Reserves the next insertion sequence number, for an event that
+        will only be put into the scheduler later (see put).
+        """
+        return next(self.counter)
+
+    def get(self):
+        """ Pops the next event, in (time, priority class, sequence) order.
+        """
+        if not self.heap:
+            raise IndexError("Tried to get event from empty HeapScheduler")
+        return heapq.heappop(self.heap)[3]
+
+    def peekTime(self):
+        """ Returns the time of the next event, without popping it.
+        """
+        if not self.heap:
+            raise IndexError("Tried to peek event from empty HeapScheduler")
+        return self.heap[0][0]
+
+    def peekKey(self):
+        """ Returns the (time, priority class, sequence) key of the next
+        event, without popping it.
+        """
+        if not self.heap:
+            raise IndexError("Tried to peek event from empty HeapScheduler")
+        return self.heap[0][:3]
+
+    def empty(self):
+        """ Returns True if there are no pending events.
+        """
+        return not self.heap
+
+    def qsize(self):
+        """ Returns the number of pending events.
+        """
+        return len(self.heap)
+
+
+class CalendarScheduler:
+    """A calendar queue (R. Brown, 1988) with amortized O(1) put and get.
+
+    Time is divided into "days" of a fixed width, and the days are hashed onto
+    a circular array of buckets, so that each bucket holds the events of every
+    day that maps onto it, kept sorted by key. Dequeuing walks the calendar
+    day by day from the last dequeued event. The number of buckets doubles or
+    halves with the number of pending events, and the day width is then
+    re-estimated from the spacing of the earliest events, so each bucket only
+    holds a handful of events.
+
+    Events are ordered by the same (time, priority class, sequence) key as in
+    HeapScheduler, so both schedulers produce identical simulations.
+    """
+
+    # Number of events sampled when re-estimating the day width.
+    WIDTH_SAMPLE = 25
+
+    def __init__(self, width = 1.0, nbuckets = 2):
+        """ Initializes an empty calendar.
+
+        :param width: Initial width of a bucket (one day), in milliseconds.
+        :type width: float
+
+        :param nbuckets: Initial number of buckets.
+        :type nbuckets: int
+        """
+        self.counter = itertools.count()
+        self.size = 0
+        self.minBuckets = nbuckets
+
+        # Virtual bucket (day number) of the last dequeued event.
+        self.day = 0
+        self.resize(nbuckets, width, [])
+
+    def resize(self, nbuckets, width, entries):
+        """ Rebuilds the calendar with the given number of buckets and day
+        width, and re-files the given entries into it.
+
+        :param nbuckets: The new number of buckets.
+        :type nbuckets: int
+
+        :param width: The new day width, in milliseconds.
+        :type width: float
+
+        :param entries: The pending (time, priority, sequence, event) entries.
+        :type entries: list<tuple>
+        """
+        self.nbuckets = nbuckets
+        self.width = width
+        self.buckets = [[] for i in range(nbuckets)]
+        for entry in entries:
+            self.buckets[int(entry[0] / width) % nbuckets].append(entry)
+        for bucket in self.buckets:
+            bucket.sort()
+
+        if entries:
+            self.day = int(min(entries)[0] / width)
+        self.growAt = 2 * nbuckets
+        self.shrinkAt = nbuckets // 2 if nbuckets > self.minBuckets else -1
+
+    def newWidth(self):
+        """ Estimates a day width from the average separation of the
+        earliest pending events, ignoring unusually large gaps.
+        """
+        entries = [entry for bucket in self.buckets for entry in bucket]
+        times = sorted(set(entry[0] for entry in
+                    heapq.nsmallest(self.WIDTH_SAMPLE, entries)))
+        if len(times) < 2:
+            return self.width, entries
+
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        average = sum(gaps) / len(gaps)
+        gaps = [gap for gap in gaps if gap <= 2 * average]
+        average = sum(gaps) / len(gaps)
+        if average <= 0:
+            return self.width, entries
+        return 3 * average, entries
+
+    def put(self, event, sequence = None):
+        """ Inserts an event into the scheduler.
+
+        :param event: The event to schedule.
+        :type event: Event
+
+        :param sequence: A number obtained earlier from reserve(), to order
+            the event as if it had been inserted at that point.
+        :type sequence: int
+        """
+        if event.packet is None:
+            priority = PRIORITY_NOPACKET
+        else:
+            priority = PRIORITY_PACKET
+        if sequence is None:
+            sequence = next(self.counter)
+        entry = (event.time, priority, sequence, event)
+
+        day = int(event.time / self.width)
+        if day < self.day:
+            self.day = day
+        bucket = self.buckets[day % self.nbuckets]
+        if not bucket or bucket[-1] < entry:
+            bucket.append(entry)
+        else:
+            bisect.insort(bucket, entry)
+
+        self.size += 1
+        if self.size > self.growAt:
+            width, entries = self.newWidth()
+            self.resize(2 * self.nbuckets, width, entries)
+
+    def nextBucket(self):
+        """ Finds the bucket holding the earliest pending event, and moves
+        the calendar to that event's day.
+        """
+        buckets = self.buckets
+        nbuckets = self.nbuckets
+        width = self.width
+        day = self.day
+
+        # Walk the calendar for at most one year, looking for an event
+        # that belongs to the day being scanned.
+        lastDay = day + nbuckets
+        while day < lastDay:
+            bucket = buckets[day % nbuckets]
+            if bucket and int(bucket[0][0] / width) <= day:
+                break
+            day += 1
+        else:
+            # Nothing within a year: jump straight to the earliest event.
+            bucket = min((b for b in buckets if b), key = lambda b: b[0])
+            day = int(bucket[0][0] / width)
+
+        self.day = day
+        return bucket
+
+    def get(self):
+        """ Pops the next event, in (time, priority class, sequence) order.
+        """
+        if self.size == 0:
+            raise IndexError("Tried to get event from empty CalendarScheduler")
+
+        entry = self.nextBucket().pop(0)
+
+        self.size -= 1
+        if self.size < self.shrinkAt:
+            width, entries = self.newWidth()
+            self.resize(self.nbuckets // 2, width, entries)
+        return entry[3]
+
+    def reserve(self):
+        """ Reserves the next insertion sequence number, for an event that
+        will only be put into the scheduler later (see put).
+        """
+        return next(self.counter)
+
+    def peekTime(self):
+        """ Returns the time of the next event, without popping it.
+        """
+        if self.size == 0:
+            raise IndexError("Tried to peek event from empty CalendarScheduler")
+        return self.nextBucket()[0][0]
+
+    def peekKey(self):
+        """ Returns the (time, priority class, sequence) key of the next
+        event, without popping it.
+        """
+        if self.size == 0:
+            raise IndexError("Tried to peek event from empty CalendarScheduler")
+        return self.nextBucket()[0][:3]
+
+    def empty(self):
+        """ Returns True if there are no pending events.
+        """
+        return self.size == 0
+
+    def qsize(self):
+        """ Returns the number of pending events.
+        """
+        return self.size
+
+
+
+class Timer(object):
+    """A timer armed on a TimingWheel. It holds the event to schedule when
+    the timer fires."""
+
+    __slots__ = ('time', 'tick', 'event', 'sequence', 'slot')
+
+    def __init__(self, time, tick, event, sequence = None):
+        """ Instantiates a Timer.
+
+        :param time: Time at which the timer fires, in milliseconds.
+        :type time: float
+
+        :param tick: The wheel tick the time falls into.
+        :type tick: int
+
+        :param event: The event to schedule when the timer fires.
+        :type event: Event
+
+        :param sequence: Scheduler sequence number reserved for the event.
+        :type sequence: int
+        """
+        self.time = time
+        self.tick = tick
+        self.event = event
+        self.sequence = sequence
+
+        # The wheel slot holding the timer; None once fired or cancelled.
+        self.slot = None
+
+
+class TimingWheel:
+    """A hierarchical timing wheel, for timers that are usually cancelled
+    before they fire (e.g. retransmission timeouts).
+
+    Time is divided into ticks of a fixed resolution. Level 0 has one slot
+    per tick for the next SLOTS ticks; each higher level has one slot per
+    revolution of the level below it. A timer is filed at the lowest level
+    that can hold it, and is moved down ("cascaded") when the wheel reaches
+    its slot at that level, so arming and cancelling a timer are O(1). Only
+    timers that actually fire are handed to the main scheduler.
+    """
+
+    # Slots per level, as a power of 2.
+    BITS = 8
+    SLOTS = 1 << BITS
+    MASK = SLOTS - 1
+
+    def __init__(self, resolution = 1.0, levels = 4):
+        """ Initializes an empty wheel.
+
+        :param resolution: Length of a tick, in milliseconds.
+        :type resolution: float
+
+        :param levels: Number of levels. Timers further away than the
+            range of the top level are re-filed when its slot comes up.
+        :type levels: int
+        """
+        self.resolution = float(resolution)
+        self.levels = levels
+        self.wheels = [[set() for i in range(self.SLOTS)] for level in range(levels)]
+
+        # Every tick before this one has already been released.
+        self.tick = 0
+        self.size = 0
+
+        # Timers armed for a tick that was already released. They are
+        # returned by the next call to advance().
+        self.overdue = set()
+
+    def place(self, timer):
+        """ Files a timer in the slot that holds its tick.
+
+        :param timer: The timer to file.
+        :type timer: Timer
+        """
+        delta = timer.tick - self.tick
+        level = 0
+        while level < self.levels - 1 and delta >= (1 << (self.BITS * (level + 1))):
+            level += 1
+        slot = self.wheels[level][(timer.tick >> (self.BITS * level)) & self.MASK]
+        slot.add(timer)
+        timer.slot = slot
+
+    def arm(self, time, event, sequence = None):
+        """ Arms a timer that schedules the event at the given time.
+        Returns the Timer, which can be passed to cancel().
+
+        :param time: Time at which the timer fires, in milliseconds.
+        :type time: float
+
+        :param event: The event to schedule when the timer fires.
+        :type event: Event
+
+        :param sequence: Scheduler sequence number reserved for the event,
+            so it keeps its place among events at the same time.
+        :type sequence: int
+        """
+        timer = Timer(time, int(time / self.resolution), event, sequence)
+        if timer.tick < self.tick:
+            self.overdue.add(timer)
+            timer.slot = self.overdue
+        else:
+            self.place(timer)
+        self.size += 1
+        return timer
+
+    def cancel(self, timer):
+        """ Cancels a timer. Returns True if it was still armed, False if
+        it had already fired or been cancelled.
+
+        :param timer: The timer to cancel.
+        :type timer: Timer
+        """
+        if timer.slot is None:
+            return False
+        timer.slot.discard(timer)
+        timer.slot = None
+        self.size -= 1
+        return True
+
+    def empty(self):
+        """ Returns True if there are no armed timers.
+        """
+        return self.size == 0
+
+    def nextTime(self):
+        """ Returns the earliest time of an armed timer. This looks at every
+        timer, so it is only used when nothing else is scheduled.
+        """
+        if self.overdue:
+            return min(timer.time for timer in self.overdue)
+        return min(timer.time for wheel in self.wheels
+                   for slot in wheel for timer in slot)
+
+    def advance(self, time):
+        """ Moves the wheel up to the given time, and returns the timers in
+        the first non-empty tick up to and including the one holding that
+        time. Some of them may fire slightly after the given time, but
+        within its tick.
+
+        The wheel stops at the first tick that releases timers, since the
+        events they schedule may arm new timers before the given time.
+
+        :param time: The time to advance to, in milliseconds.
+        :type time: float
+        """
+        fired = []
+        if self.overdue:
+            for timer in self.overdue:
+                timer.slot = None
+            fired.extend(self.overdue)
+            self.overdue.clear()
+            self.size -= len(fired)
+            return fired
+
+        target = int(time / self.resolution)
+        if target < self.tick:
+            return fired
+        if self.size == 0:
+            self.tick = target + 1
+            return fired
+
+        wheels = self.wheels
+        while self.tick <= target:
+            tick = self.tick
+            if tick & self.MASK == 0:
+                # Cascade from the top level down, so timers moved out of a
+                # higher level can land in a slot that is cascaded next.
+                for level in range(self.levels - 1, 0, -1):
+                    if tick & ((1 << (self.BITS * level)) - 1) == 0:
+                        slot = wheels[level][(tick >> (self.BITS * level)) & self.MASK]
+                        timers = list(slot)
+                        slot.clear()
+                        for timer in timers:
+                            self.place(timer)
+
+            self.tick = tick + 1
+            slot = wheels[0][tick & self.MASK]
+            if slot:
+                for timer in slot:
+                    timer.slot = None
+                fired.extend(slot)
+                slot.clear()
+                break
+
+        self.size -= len(fired)
+        return fired
+
+
+# Schedulers selectable from the command line.
+SCHEDULERS = {
+    'heap': HeapScheduler,
+    'calendar': CalendarScheduler,
+}
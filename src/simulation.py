@@ -1,38 +1,63 @@
-import Queue
-import datetime
-import time
+import collections
+import numpy as np
 import constants
 import metrics
+import routing
 from classes import *
-
-class Event:
-    """Events are enqueued into the Simulator priority queue by their time. Events
-    have a type (PUT, SEND, RECEIVE, GENERATEACK, GENERATEPACK) describing what is
+from scheduler import HeapScheduler, TimingWheel, PRIORITY_NOPACKET, PRIORITY_PACKET
+from events import *
+from tracing import Tracer
+
+# Why Simulator.run stopped.
+STOP_EMPTY = 'empty'                    # no events left
+STOP_FLOWS_COMPLETE = 'flows complete'  # every flow was acknowledged
+STOP_UNTIL = 'until'                    # the next event is after the end time
+STOP_MAX_EVENTS = 'max events'          # the event limit was reached
+
+# What Simulator.run returns.
+#   events: number of events processed.
+#   time: time of the last event processed, in ms.
+#   reason: why the run stopped (one of the STOP_ constants).
+RunResult = collections.namedtuple('RunResult', ['events', 'time', 'reason'])
+
+class Event(object):
+    """Events are enqueued into the Simulator's scheduler by their time. Events
+    have a type (PUT, TXCOMPLETE, RECEIVE, GENERATEACK, SELECTPACK, ...) describing what is
     done to the packet. Each type of event has an associated network handler
     (Link, Device, Flow, respectively).
     """
 
+    __slots__ = ('packet', 'handler', 'type', 'time', 'flow')
+
     def __init__(self, packet, EventHandler, EventType, EventTime, flow):
         """ This will initialize an event.
 
         :param packet: The packet associated with the event.
-        :type packet: Packet/None (None for GENERATE...)
+        :type packet: Packet or None (see below)
 
         :param EventHandler: Object associated with event request.
-        :type EventHandler: Device, Link, or None
+        :type EventHandler: (Link, Device), Link, int, or None (see below)
 
         :param EventType: The type of event that will be sent.
-        :type EventType: str
+        :type EventType: int (one of the event type constants)
 
         :param EventTime: The time of the particular event, in milliseconds.
         :type EventTime: int
 
+        The event types are defined in events.py (see events.EVENT_NAMES):
+
         EventType               EventHandler        Packet Type
-        PUT                     (Link, Device)      DATA, ACK
-        SEND                    (Link, Device)      None
-        RECEIVE                 Device              DATA, ACK
-        GENERATEACK             None                None
-        GENERATEPACK            None                None
+        INITIALIZEFLOW          None                None
+        REROUT                  None                None
+        UPDATEWINDOW            None                None
+        PUT                     (Link, Device)      DATA, ACK, ROUT
+        TXCOMPLETE              Link                DATA, ACK, ROUT
+        RECEIVE                 Link                DATA, ACK, ROUT
+        GENERATEACK             None                DATA
+        SELECTPACK              None                None
+        RESEND                  None                None
+        TIMEOUT                 packet index (int)  None
+        SAMPLE                  None                None
 
         """
 
@@ -43,41 +68,12 @@ class Event:
 
         self.flow = flow
 
-    def __cmp__(self, other):
-        """Orders events by (in order of importance):
-        1) The event's time.
-        2) Which event contains a packet. The event without a packet is
-            processed first, since these events are almost instantaneous.
-        3) Which event's packetID is smaller. Smaller packetIDs
-            were generated first, so process them first.
-
-        :param other: The other event we're comparing with.
-        :type other: Event
-        """
-
-        if(isinstance(self.packet, RoutingPacket)):
-            return cmp(self.time, other.time)
-
-        if self.time != other.time:
-            return cmp(self.time, other.time)
-        else:
-            if self.packet is None and other.packet is None:
-                return 0
-            elif self.packet is None:
-                return -1
-            elif other.packet is None:
-                return 1
-            elif len(other.packet.packetID) != len(self.packet.packetID):
-                return cmp(len(self.packet.packetID), len(other.packet.packetID))
-            else:
-                return cmp(self.packet.packetID, other.packet.packetID)
-
-
 
 class Simulator:
-    def __init__(self, network, TCP_type, metric):
-        """ This will initialize the simulation with a Priority Queue
-        that sorts based on time.
+    def __init__(self, network, TCP_type, metric, scheduler = None, tracer = None,
+            routingMode = 'flood', rerouteThreshold = constants.REROUT_THRESHOLD):
+        """ This will initialize the simulation with a scheduler
+        that sorts events based on time.
 
         :param network: Network system parsed from json
         :type network : Network
@@ -88,8 +84,61 @@ class Simulator:
         :param metric: The class responsible for logging all metrics.
             Can be None, if no data is to be logged.
         :type metric: Metrics
+
+        :param scheduler: The pending event set. Any object providing
+            put(event, sequence), reserve(), get(), peekTime(), peekKey(),
+            empty() and qsize() can be used; defaults
+            to a HeapScheduler.
+        :type scheduler: HeapScheduler, CalendarScheduler
+
+        :param tracer: Receives a trace of every event processed. Defaults
+            to a disabled Tracer, which costs nothing.
+        :type tracer: Tracer
+
+        :param routingMode: How routing tables are computed (one of
+            routing.ROUTING_MODES): by flooding RoutingPackets, or
+            directly with Dijkstra's algorithm ('spf'), possibly only
+            recomputing the tables affected by changed links
+            ('incremental').
+        :type routingMode: str
+
+        :param rerouteThreshold: With incremental routing, relative change
+            of a link's cost needed before its routes are recomputed.
+        :type rerouteThreshold: float
         """
-        self.q = Queue.PriorityQueue()
+        self.routingMode = routingMode
+        self.rerouteThreshold = rerouteThreshold
+
+        # Tracks the link costs for incremental routing, once static
+        # routing has been done.
+        self.incrementalRouting = None
+
+        if scheduler is None:
+            scheduler = HeapScheduler()
+        self.q = scheduler
+
+        if tracer is None:
+            tracer = Tracer()
+        self.tracer = tracer
+
+        # Time of the event being processed.
+        self.now = 0
+
+        # Events scheduled at the current time skip the scheduler: they
+        # are kept in FIFO order as (sequence, event), one queue per
+        # priority class.
+        self.immediate = (collections.deque(), collections.deque())
+
+        # The flow of the last ACK received by a host, so run() only checks
+        # whether the flows are complete when that may have changed.
+        self.ackedFlow = None
+
+        # Events that have been processed, and can be reused by createEvent.
+        self.eventPool = []
+
+        # Retransmission timeouts are kept out of the scheduler until they
+        # fire, since almost all of them are cancelled by an ACK first.
+        self.timers = TimingWheel()
         self.network = network
 
         self.tcp_type = TCP_type
@@ -106,13 +155,155 @@ class Simulator:
         self.LOG_WINDOWSIZE = 1
         self.LOG_PACKETDELAY = 2
 
+        # With --more, metrics are logged after every event. Otherwise,
+        # SAMPLE events log them once per LOG_TIME_INTERVAL, from the
+        # network's state tables. sampled holds the snapshot of the tables
+        # taken at the previous sample.
+        self.logEveryEvent = metric is not None and metric.log == 'more'
+        self.sampled = None
+
+        # Number of pending REROUT, SAMPLE and UPDATEWINDOW events. These
+        # reschedule themselves, so they stop once they are all that is
+        # left (see idle).
+        self.periodic = 0
+
+        # Handler for each event type, indexed by the event type.
+        self.handlers = [
+            self.handleInitializeFlow,
+            self.handleRerout,
+            self.handleUpdateWindow,
+            self.handlePut,
+            self.handleTxComplete,
+            self.handleReceive,
+            self.handleGenerateAck,
+            self.handleSelectPack,
+            self.handleResend,
+            self.handleTimeout,
+            self.handleSample,
+        ]
+
+    def createEvent(self, packet, EventHandler, EventType, EventTime, flow):
+        """ Returns a new event, reusing a processed one from the pool if
+        there is one. Takes the same arguments as Event.
+        """
+        if self.eventPool:
+            event = self.eventPool.pop()
+            event.packet = packet
+            event.handler = EventHandler
+            event.type = EventType
+            event.time = EventTime
+            event.flow = flow
+            return event
+        return Event(packet, EventHandler, EventType, EventTime, flow)
+
     def insertEvent(self, event):
-        """ This will insert an event into the Priority Queue.
+        """ This will insert an event into the scheduler.
 
         :param event: This is the event we're adding into the queue.
         :type event: Event
         """
-        self.q.put(event)
+        if event.time == self.now:
+            # Every event at the current time that is already in the
+            # scheduler has a smaller sequence number, so appending keeps
+            # each queue sorted.
+            if event.packet is None:
+                queue = self.immediate[PRIORITY_NOPACKET]
+            else:
+                queue = self.immediate[PRIORITY_PACKET]
+            queue.append((self.q.reserve(), event))
+        else:
+            self.q.put(event)
+
+    def nextEvent(self):
+        """ Pops the next event, from the queues of events at the current
+        time or from the scheduler, in (time, priority class, sequence)
+        order. Returns None if there are no events left.
+        """
+        q = self.q
+        if self.immediate[PRIORITY_NOPACKET]:
+            priority = PRIORITY_NOPACKET
+        elif self.immediate[PRIORITY_PACKET]:
+            priority = PRIORITY_PACKET
+        else:
+            if q.empty():
+                return None
+            event = q.get()
+            self.now = event.time
+            return event
+
+        # Timeouts and arrivals are put into the scheduler with a sequence
+        # number reserved earlier, so they may still come first.
+        queue = self.immediate[priority]
+        sequence, event = queue[0]
+        if not q.empty() and q.peekKey() < (self.now, priority, sequence):
+            event = q.get()
+            self.now = event.time
+            return event
+        queue.popleft()
+        return event
+
+    def pending(self):
+        """ Returns the number of events waiting to be processed, not
+        counting timeouts that have not fired.
+        """
+        return self.q.qsize() + len(self.immediate[0]) + len(self.immediate[1])
+
+    def idle(self):
+        """ Returns True if the only events left are the periodic ones
+        (REROUT, SAMPLE and UPDATEWINDOW): no packet is moving and no
+        timeout is armed, so no flow can make progress any more.
+        """
+        return self.pending() == self.periodic and self.timers.empty()
+
+    def schedulePeriodic(self, eventType, time, flow = None):
+        """ Schedules a REROUT, SAMPLE or UPDATEWINDOW event.
+
+        :param eventType: The type of the event.
+        :type eventType: int
+
+        :param time: The time of the event, in milliseconds.
+        :type time: float
+
+        :param flow: The flow of an UPDATEWINDOW event.
+        :type flow: Flow
+        """
+        self.periodic += 1
+        self.insertEvent(self.createEvent(None, None, eventType, time, flow))
+
+    def armTimeout(self, flow, packetIdx, time):
+        """ Arms the retransmission timer of a packet: a TIMEOUT event is
+        scheduled at the given time, unless the packet is acknowledged first.
+
+        :param flow: The flow the packet belongs to.
+        :type flow: Flow
+
+        :param packetIdx: The index of the packet in the flow.
+        :type packetIdx: int
+
+        :param time: The time of the timeout, in milliseconds.
+        :type time: float
+        """
+        event = self.createEvent(None, packetIdx, TIMEOUT, time, flow)
+        timer = self.timers.arm(time, event, self.q.reserve())
+        flow.retransmitTimers.setdefault(packetIdx, []).append(timer)
+
+    def cancelTimeouts(self, flow, packetIdx):
+        """ Cancels the retransmission timers of an acknowledged packet.
+
+        :param flow: The flow the packet belongs to.
+        :type flow: Flow
+
+        :param packetIdx: The index of the packet in the flow.
+        :type packetIdx: int
+        """
+        timers = flow.retransmitTimers.pop(packetIdx, None)
+        if timers:
+            for timer in timers:
+                if self.timers.cancel(timer):
+                    event = timer.event
+                    event.handler = event.flow = None
+                    self.eventPool.append(event)
+                timer.event = None
 
     def done(self):
         """ Called when the simulation is finished. If metrics
@@ -125,7 +316,8 @@ class Simulator:
             self.metrics.done()
 
     def logData(self, time):
-        for link_name in self.network.links:
+        # Only the tracked links and flows are logged.
+        for link_name in self.metrics.links:
             link = self.network.links[link_name]
             self.metrics.logMetric(time / constants.s_to_ms,
                     link.linkBuffer.occupancy / constants.DATA_SIZE,
@@ -135,7 +327,7 @@ class Simulator:
             self.metrics.logMetric(time / constants.s_to_ms,
                     link.currentRateMbps(None),
                     self.LOG_LINKRATE, link.linkID)
-        for flow_name in self.network.flows:
+        for flow_name in self.metrics.flows:
             flow = self.network.flows[flow_name]
             self.metrics.logMetric(time / constants.s_to_ms,
                     flow.getWindowSize(),
@@ -147,43 +339,145 @@ class Simulator:
             self.metrics.logMetric(time / constants.s_to_ms,
                     rate, self.LOG_FLOWRATE, flow.flowID)
 
+    def releaseTimers(self):
+        """ Hands the timeouts that fire before the next event to the
+        scheduler.
+        """
+        timers = self.timers
+        if timers.size:
+            if self.immediate[0] or self.immediate[1]:
+                nextTime = self.now
+            elif self.q.empty():
+                nextTime = timers.nextTime()
+            else:
+                nextTime = self.q.peekTime()
+            for timer in timers.advance(nextTime):
+                self.q.put(timer.event, timer.sequence)
+                timer.event = None
+
+    def peekTime(self):
+        """ Returns the time of the next event, or None if there are no
+        events left.
+        """
+        self.releaseTimers()
+        if self.immediate[0] or self.immediate[1]:
+            return self.now
+        if self.q.empty():
+            return None
+        return self.q.peekTime()
+
+    def run(self, until = None, max_events = None, stop_when_flows_complete = True):
+        """ Processes events until there are none left, or one of the
+        stopping criteria is met. Returns a RunResult.
+
+        :param until: Stop before processing an event later than this
+            time, in milliseconds.
+        :type until: float
+
+        :param max_events: Stop after processing this many events.
+        :type max_events: int
+
+        :param stop_when_flows_complete: Stop as soon as every flow has
+            been acknowledged, instead of draining the leftover events
+            (stale timeouts, the end of the REROUT chain, ...).
+        :type stop_when_flows_complete: bool
+        """
+        events = 0
+        self.ackedFlow = None
+        while True:
+            if max_events is not None and events >= max_events:
+                reason = STOP_MAX_EVENTS
+                break
+            if until is not None:
+                nextTime = self.peekTime()
+                if nextTime is not None and nextTime > until:
+                    reason = STOP_UNTIL
+                    break
+
+            if not self.processEvent():
+                reason = STOP_EMPTY
+                break
+            events += 1
+
+            if stop_when_flows_complete and self.ackedFlow is not None:
+                self.ackedFlow = None
+                if self.network.allFlowsComplete():
+                    reason = STOP_FLOWS_COMPLETE
+                    break
+
+        return RunResult(events, self.now, reason)
+
     def processEvent(self):
-        """Pops and processes event from queue."""
+        """Pops the next event from the scheduler and dispatches it to
+        the handler for its type. Returns False if there were no events
+        in the queue, True otherwise."""
+        self.releaseTimers()
 
-        if(self.q.empty()):
-            result += "No events in queue."
-            return
+        event = self.nextEvent()
+        if event is None:
+            return False
 
-        event = self.q.get()
+        tracer = self.tracer
+        if tracer.enabled and tracer.traces(event):
+            tracer.emit(event, "Popped event type: " + EVENT_NAMES[event.type] +
+                    " at " + str(event.time) + " ms, queue size " + str(self.pending()))
 
-        # for verbose output
-        result = ""
+        self.handlers[event.type](event)
 
-        result += "Popped event type: " \
-                + str(event.type) + " at " +  str(event.time) + " ms\n"
+        # Log all data, every time an event is done being processed.
+        if self.logEveryEvent:
+            self.logData(event.time)
 
-        if event.type == "INITIALIZEFLOW":
+        # Nothing refers to the event anymore, so it can be reused.
+        event.packet = event.handler = event.flow = None
+        self.eventPool.append(event)
+        return True
 
-            event.flow.initializePackets()
+    def handleInitializeFlow(self, event):
+        """ Starts a flow: creates its packets and selects the first window of packets to send.
 
-            increment = 1
-            result += "event.flow.window_upper: " + str(event.flow.window_upper)
-            result += "\n"
-            while(event.flow.window_counter <= floor(event.flow.window_upper)):
-                newEvent = Event(None, None, "SELECTPACK", event.time + increment * constants.EPSILON_DELAY, event.flow)
-                event.flow.window_counter = event.flow.window_counter + 1
-                self.insertEvent(newEvent)
-                increment = increment + 1
+        :param event: The INITIALIZEFLOW event to process.
+        :type event: Event
+        """
+        event.flow.initializePackets()
 
-        elif event.type == "REROUT":
-            # Recalculates routing tables.
-            result += "Initializing REROUT at time " + str(event.time) + "\n"
+        if self.tracer.enabled and self.tracer.traces(event):
+            self.tracer.emit(event, "event.flow.window_upper: " + str(event.flow.window_upper))
 
-            result += "CURRENT TABLES: \n"
+        increment = 1
+        while(event.flow.window_counter <= floor(event.flow.window_upper)):
+            newEvent = self.createEvent(None, None, SELECTPACK, event.time + increment * constants.EPSILON_DELAY, event.flow)
+            event.flow.window_counter = event.flow.window_counter + 1
+            self.insertEvent(newEvent)
+            increment = increment + 1
+
+    def handleRerout(self, event):
+        """ Recalculates the routing tables with the current link
+        latencies, by flooding every router's table or directly.
+
+        :param event: The REROUT event to process.
+        :type event: Event
+        """
+        self.periodic -= 1
+        idle = self.idle()
+
+        tracer = self.tracer
+        if tracer.enabled and tracer.traces(event):
+            tables = ""
             for deviceID in self.network.devices:
                 if(isinstance(self.network.devices[deviceID], Router)):
-                    result += str(self.network.devices[deviceID])
-
+                    tables += str(self.network.devices[deviceID])
+            tracer.emit(event, "Initializing REROUT at time " + str(event.time) +
+                    "\nCURRENT TABLES: \n" + tables)
+
+        if self.routingMode == 'spf':
+            routing.computeRoutingTables(self.network, routing.dynamicWeight)
+        elif self.routingMode == 'incremental':
+            changedLinks, recomputed = self.incrementalRouting.update()
+            if tracer.enabled and tracer.traces(event):
+                tracer.emit(event, str(changedLinks) + " links changed, " +
+                        str(recomputed) + " routing tables recomputed")
+        else:
             for deviceID in self.network.devices:
                 device = self.network.devices[deviceID]
                 if(isinstance(device, Router)):
@@ -193,249 +487,465 @@ class Simulator:
                     routingPackets = device.floodNeighbors(dynamic = True)
 
                     for (pack, link) in routingPackets:
-                        newEvent3 = Event(pack, (link, device), "PUT",
+                        newEvent3 = self.createEvent(pack, (link, device), PUT,
                                     event.time + constants.EPSILON_DELAY,
                                     flow = None)
                         self.insertEvent(newEvent3)
 
-            if(not self.network.allFlowsComplete()):
-                newEvent2 = Event(None, None, "REROUT",
-                    event.time + constants.REROUT_TIME, None)
-                self.insertEvent(newEvent2)
+        if(not self.network.allFlowsComplete() and not idle):
+            self.schedulePeriodic(REROUT, event.time + constants.REROUT_TIME)
 
+    def startSampling(self, time):
+        """ Schedules the first SAMPLE event, one LOG_TIME_INTERVAL after
+        the given time. What the links and flows did until then is not
+        sampled.
 
-        elif event.type == "UPDATEWINDOW":
-            # Updates the current window.
+        :param time: When sampling starts, in ms.
+        :type time: float
+        """
+        state = self.network.state
+
+        # Rows of the tracked links and flows, and of the links the flows
+        # send on, in the network's state tables.
+        self.sampledLinks = [state.linkIndex[linkID] for linkID in self.metrics.links]
+        self.sampledFlows = [state.flowIndex[flowID] for flowID in self.metrics.flows]
+        self.sampledSources = [state.linkIndex[self.network.flows[flowID].src.getLink().linkID]
+                               for flowID in self.metrics.flows]
+        self.linkDelays = np.array([self.network.links[linkID].delay
+                                    for linkID in state.linkIDs], dtype = float)
+
+        self.sampled = state.snapshot()
+
+        self.schedulePeriodic(SAMPLE, time + constants.LOG_TIME_INTERVAL * constants.s_to_ms)
+
+    def handleSample(self, event):
+        """ Logs the metrics of the tracked links and flows for the interval
+        that just ended. With --avg, rates are the bytes sent during the
+        interval and delays are averaged over it; with --less, they are
+        the current values. Buffer occupancy and window size are always
+        the current values, and packet loss counts the drops during the
+        interval.
+
+        :param event: The SAMPLE event to process.
+        :type event: Event
+        """
+        self.periodic -= 1
+        interval = constants.LOG_TIME_INTERVAL * constants.s_to_ms
+        sampleTime = event.time / constants.s_to_ms
+
+        # The whole network is sampled at once, and the metrics of every
+        # link and flow are computed from the snapshots with array
+        # operations.
+        links, flows = self.network.state.snapshot()
+        lastLinks, lastFlows = self.sampled
+        self.sampled = (links, flows)
+
+        if self.metrics.log == 'avg':
+            rates = self.rateMbps(links[:, LINK_BYTES_SENT] -
+                    lastLinks[:, LINK_BYTES_SENT], interval)
+            delayCounts = flows[:, FLOW_DELAY_COUNT] - \
+                    lastFlows[:, FLOW_DELAY_COUNT]
+            delays = np.where(delayCounts > 0,
+                    (flows[:, FLOW_DELAY_SUM] - lastFlows[:, FLOW_DELAY_SUM]) /
+                    np.maximum(delayCounts, 1),
+                    flows[:, FLOW_DELAY])
+        else:
+            rates = self.rateMbps(links[:, LINK_IN_FLIGHT], self.linkDelays)
+            delays = flows[:, FLOW_DELAY]
+        buffers = links[:, LINK_OCCUPANCY] // constants.DATA_SIZE
+        drops = links[:, LINK_DROPS] - lastLinks[:, LINK_DROPS]
+
+        for linkID, index in zip(self.metrics.links, self.sampledLinks):
+            self.metrics.logSample(sampleTime, rates[index], self.LOG_LINKRATE, linkID)
+            self.metrics.logSample(sampleTime, buffers[index], self.LOG_BUFFERSIZE, linkID)
+            self.metrics.logSample(sampleTime, drops[index], self.LOG_PACKETLOSS, linkID)
+
+        for flowID, index, source in zip(self.metrics.flows, self.sampledFlows,
+                                         self.sampledSources):
+            self.metrics.logSample(sampleTime, rates[source], self.LOG_FLOWRATE, flowID)
+            self.metrics.logSample(sampleTime, flows[index, FLOW_WINDOW],
+                    self.LOG_WINDOWSIZE, flowID)
+            self.metrics.logSample(sampleTime, delays[index], self.LOG_PACKETDELAY, flowID)
+
+        if(not self.network.allFlowsComplete() and not self.idle()):
+            self.schedulePeriodic(SAMPLE, event.time + interval)
+
+    def rateMbps(self, byteCount, interval):
+        """ Returns the rate, in Mbps, of sending a number of bytes over an
+        interval.
+
+        :param byteCount: Number of bytes sent.
+        :type byteCount: float/numpy.ndarray
+
+        :param interval: Length of the interval, in ms.
+        :type interval: float/numpy.ndarray
+        """
+        return (byteCount /
+                (constants.MB_TO_KB * constants.KB_TO_B / constants.B_to_b) /
+                (interval / constants.s_to_ms))
 
-            # If no new packets were receieved between now and last
-            # updatewindow, we have to make our RTT higher
-            if event.flow.received_packet == False:
-                result += "last_receieved_packet: " + str(event.flow.last_received_packet_start_time)
-                #figure out the appropriate value
-                event.flow.actualRTT = event.time - event.flow.last_received_packet_start_time
+    def handleUpdateWindow(self, event):
+        """ Updates the TCP-FAST window of a flow.
 
+        :param event: The UPDATEWINDOW event to process.
+        :type event: Event
+        """
+        self.periodic -= 1
 
-            event.flow.TCPFast(constants.alpha)
+        # If no new packets were receieved between now and last
+        # updatewindow, we have to make our RTT higher
+        if event.flow.received_packet == False:
+            if self.tracer.enabled and self.tracer.traces(event):
+                self.tracer.emit(event, "last_receieved_packet: " +
+                        str(event.flow.last_received_packet_start_time))
+            #figure out the appropriate value
+            event.flow.actualRTT = event.time - event.flow.last_received_packet_start_time
 
-            # Reset the max RTT
-            event.flow.actualRTT = event.flow.theoRTT
 
-            # Reset the received packet
-            event.flow.received_packet = False
+        event.flow.TCPFast(constants.alpha)
 
-            # Add next updatewindow to queue
-            if not event.flow.flowComplete():
-                newEvent2 = Event(None, None, "UPDATEWINDOW", event.time + constants.UPDATE_WINDOW_TIME, event.flow)
-                self.insertEvent(newEvent2)
+        # Reset the max RTT
+        event.flow.actualRTT = event.flow.theoRTT
 
-        elif event.type == "PUT":
-            # Tries to put packet into link buffer
-            # This happens whenever a device receives a packet.
-            assert(isinstance(event.handler[0], Link))
-            assert(isinstance(event.handler[1], Device))
-            link = event.handler[0]
-            device = event.handler[1]
+        # Reset the received packet
+        event.flow.received_packet = False
 
-            result += str(event.packet.data_type) + " " + str(event.packet.packetID) + "\n"
+        # Add next updatewindow to queue
+        if not event.flow.flowComplete() and not self.idle():
+            self.schedulePeriodic(UPDATEWINDOW, event.time + constants.UPDATE_WINDOW_TIME, event.flow)
 
-            result += "Putting " + event.packet.data_type + str(event.packet.packetID) + " into link " + str(link.linkID) + \
-                  " from Device " + str(device.deviceID) + " at time " + str(event.time) + str(event.flow) + "\n"
+    def handlePut(self, event):
+        """ Tries to put a packet into a link buffer, dropping it if the
+        buffer is full.
 
-            result +=  "Link " + str(link.linkID) + " with buffer size " + str(link.linkBuffer.occupancy) + "\n"
+        :param event: The PUT event to process.
+        :type event: Event
+        """
+        # Tries to put packet into link buffer
+        # This happens whenever a device receives a packet.
+        assert(isinstance(event.handler[0], Link))
+        assert(isinstance(event.handler[1], Device))
+        link = event.handler[0]
+        device = event.handler[1]
+
+        tracer = self.tracer
+        if tracer.enabled and tracer.traces(event, link):
+            tracer.emit(event, "Putting " + event.packet.data_type + str(event.packet) +
+                    " into link " + str(link.linkID) + " from Device " + str(device.deviceID) +
+                    " at time " + str(event.time) + ", link buffer size " +
+                    str(link.linkBuffer.occupancy), link)
+
+        # Can packet be put into linkBuffer?
+        if not link.linkBuffer.bufferFullWith(event.packet):
+            device.sendToLink(link, event.packet)
+
+            # Wake the transmitter up if it was idle.
+            if link.transmitting is None:
+                self.startTransmission(link, event.time)
+
+        else: # Packet is dropped
+            link.recordDrop()
+            if tracer.enabled and tracer.traces(event, link):
+                tracer.emit(event, "Packet " + str(event.packet) + " dropped"
+                        " at time " + str(event.time) + " by link " + str(link.linkID), link)
+            if event.packet.data_type == "ACK":
+                event.packet.flow.releaseAckPacket(event.packet)
+
+    def startTransmission(self, link, time):
+        """ Starts transmitting the next packet in a link buffer, and
+        schedules the end of its transmission.
+
+        :param link: An idle link with a non-empty buffer.
+        :type link: Link
+
+        :param time: The current time, in milliseconds.
+        :type time: float
+        """
+        packet = link.startTransmission()
+        newEvent = self.createEvent(packet, link, TXCOMPLETE,
+                time + link.transmissionTime(packet), None)
+        self.insertEvent(newEvent)
 
-            # Can packet be put into linkBuffer?
-            if not link.linkBuffer.bufferFullWith(event.packet):
-                device.sendToLink(link, event.packet)
+    def handleTxComplete(self, event):
+        """ A link has finished transmitting a packet: the packet propagates
+        to the other device, and the link starts transmitting the next
+        packet in its buffer, or goes idle.
 
-                newEvent = Event(None, link, "SEND", event.time, event.flow)
-                self.insertEvent(newEvent)
+        :param event: The TXCOMPLETE event to process.
+        :type event: Event
+        """
+        assert(isinstance(event.handler, Link))
+        link = event.handler
+        packet = link.finishTransmission()
+
+        if self.tracer.enabled and self.tracer.traces(event, link):
+            self.tracer.emit(event, "Sent " + packet.data_type + str(packet) +
+                    " into link " + str(link.linkID) + " to Device " + str(packet.nextDev.deviceID) +
+                    " with destination " + str(packet.dest.deviceID) + " at time " +
+                    str(event.time), link)
+
+        # The packet arrives after the link delay. Its place among events at
+        # the same time is fixed now, even if its RECEIVE event is only
+        # scheduled once the packets ahead of it have arrived.
+        if link.propagate(packet, event.time + link.delay, self.q.reserve()):
+            self.scheduleArrival(link)
+
+        if not link.linkBuffer.empty():
+            self.startTransmission(link, event.time)
+
+    def scheduleArrival(self, link):
+        """ Schedules the RECEIVE event for the packet at the head of a
+        link's in-flight FIFO. Each link has at most one such event pending.
+
+        :param link: A link with packets in flight.
+        :type link: Link
+        """
+        arrival, sequence, packet, device = link.nextArrival()
+        newEvent = self.createEvent(packet, link, RECEIVE, arrival, packet.flow)
+        self.q.put(newEvent, sequence)
 
-            else: # Packet is dropped
-                link.isDropped = True
-                result += "Packet " + str(event.packet.packetID) + " dropped"\
-                        " at time " + str(event.time) + " by " + str(link) + "\n"
-
-
-        elif event.type == "SEND":
-            # Processes a link to send.
-            assert(isinstance(event.handler, Link))
-            link = event.handler
-
-            # If there is an empty buffer...
-            if len(link.linkBuffer.packets) != 0:
-                packet = link.sendPacket()
-
-                if(packet != None):
-                    # It's possible that there's a mismatch between a sending event and the appropriate
-                    # type of packet, so check the packet's ID to see if originally had a flow
-                    packetflowID = packet.recallFlowID()
-                    for flow_name in self.network.flows:
-                        if flow_name == packetflowID:
-                            event.flow = self.network.flows[flow_name]
-                    # propagation time.
-                    propagationTime = (float(packet.data_size * constants.B_to_b) / (constants.KB_TO_B * constants.MB_TO_KB)) / link.maxRate
-
-                    otherDev = packet.nextDev
-                    result += "Sending " + packet.data_type + str(packet.packetID) + " into link " + str(link.linkID) + \
-                      " to Device " + str(otherDev.deviceID) + " with destination " + str(packet.dest.deviceID) + " at time " + str(event.time) + str(event.flow)
-                    newEvent = Event(packet, otherDev, "RECEIVE",
-                                     event.time + propagationTime + link.delay, event.flow)
-                    self.insertEvent(newEvent)
+    def handleReceive(self, event):
+        """ The packet at the head of a link's in-flight FIFO reaches the
+        host or router at the other end of the link.
 
-        elif event.type == "RECEIVE":
-            # Processes a host/router action that would receive things.
-            assert(isinstance(event.handler, Device))
-            sendLink = event.packet.currLink
+        :param event: The RECEIVE event to process.
+        :type event: Event
+        """
+        assert(isinstance(event.handler, Link))
+        sendLink = event.handler
+        arrival, sequence, packet, device = sendLink.arrive()
+
+        # Schedule the arrival of the next packet in flight on this link.
+        if sendLink.inFlight:
+            self.scheduleArrival(sendLink)
+
+        # Processes a host/router action that would receive things.
+        event.handler = device
+        event.packet = packet
+
+        tracer = self.tracer
+
+        # Router receives packet
+        if isinstance(event.handler, Router):
+            router = event.handler
+
+            if(isinstance(event.packet, RoutingPacket)):
+                if tracer.enabled and tracer.traces(event, sendLink):
+                    tracer.emit(event, "Handling RoutingPacket at Router " +
+                            str(router.deviceID) + " at time " + str(event.time), sendLink)
+
+                _continue = router.handleRoutingPacket(event.packet)
+                if(_continue):
+                    # flood neighbors
+                    newPackets = router.floodNeighbors()
+
+                    for (pack, link) in newPackets:
+                        newEvent = self.createEvent(pack, (link, router),
+                                         PUT, event.time,
+                                         flow = None)
+                        self.insertEvent(newEvent)
+
+            elif(isinstance(event.packet, DataPacket)):
+                if tracer.enabled and tracer.traces(event, sendLink):
+                    tracer.emit(event, "Receiving " + event.packet.data_type + str(event.packet) +
+                            " to Router " + str(router.deviceID) + " at time " + str(event.time), sendLink)
 
-            # Router receives packet
-            if isinstance(event.handler, Router):
-                router = event.handler
+                sendLink.decrRate(event.packet)
+                newLink = event.flow.nextLink(router, event.packet)
 
-                if(isinstance(event.packet, RoutingPacket)):
-                    result += "Handling RoutingPacket at time " + str(event.time)
+                newEvent = self.createEvent(event.packet, (newLink, router), PUT,
+                        event.time, event.flow)
+                self.insertEvent(newEvent)
 
-                    _continue = router.handleRoutingPacket(event.packet)
-                    if(_continue):
-                        # flood neighbors
-                        newPackets = router.floodNeighbors()
 
-                        for (pack, link) in newPackets:
-                            newEvent = Event(pack, (link, router),
-                                             "PUT", event.time,
-                                             flow = None)
-                            self.insertEvent(newEvent)
+        # Host receives packet
+        elif isinstance(event.handler, Host):
+            host = event.handler
+            if tracer.enabled and tracer.traces(event, sendLink):
+                tracer.emit(event, "Receiving " + event.packet.data_type + str(event.packet) +
+                        " to Host " + str(host.deviceID) + " at time " + str(event.time), sendLink)
 
-                elif(isinstance(event.packet, DataPacket)):
+            if(event.packet.data_type == "DATA"):
+                host.receive(event.packet)
 
-                    result += "Receiving " + event.packet.data_type + str(event.packet.packetID) + " to Router " + str(router.deviceID) + " at time " + str(event.time) + str(event.flow)
+                newEvent = self.createEvent(event.packet, None, GENERATEACK,
+                        event.time, event.flow)
+                self.insertEvent(newEvent)
+            elif(event.packet.data_type == "ACK"):
+                host.receive(event.packet)
+
+                isDropped = event.flow.receiveAcknowledgement(event.packet, event.time, self.tcp_type)
+                event.flow.recordDelay(event.time - event.packet.start_time)
+
+                # The packet is acknowledged now, so its timeouts would do nothing.
+                self.cancelTimeouts(event.flow, event.packet.index)
+                self.ackedFlow = event.flow
+
+                if tracer.enabled and tracer.traces(event):
+                    tracer.emit(event, "HOST EXPECT: " + str(event.flow.window_lower) +
+                            " Host received: " + str(event.packet) +
+                            " packet.start_time: " + str(event.packet.start_time) +
+                            " actualRTT: " + str(event.flow.actualRTT))
+
+                # If the packet was dropped, we will do SELECTIVE RESEND (Fast retransmit)
+                # and only resend the dropped packet. Otherwise, we send packets based on the
+                # updated window parameters (done in TCP Reno).
+                if isDropped == False:
+                    if event.flow.first_time == 0:
+                        # TCP Fast initialization event, which should happen only the first time a packet is acknowledged
+                        if self.tcp_type == 'FAST':
+                            self.schedulePeriodic(UPDATEWINDOW, event.time + (2*event.flow.actualRTT), event.flow)
+                        event.flow.first_time = 1
+
+                    if tracer.enabled and tracer.traces(event):
+                        tracer.emit(event, "ACK Packet " + str(event.packet) +
+                                " acknowledged. packets_index: " + str(event.flow.packets_index) +
+                                " window_upper: " + str(event.flow.window_upper))
+
+                    # used to insert new SELECTPACK (data packet generation) events in order
+                    increment = 1
+                    while(event.flow.window_counter <= event.flow.window_upper):
+                        newEvent = self.createEvent(None, None, SELECTPACK, event.time + increment * constants.EPSILON_DELAY, event.flow)
+                        self.insertEvent(newEvent)
+                        self.armTimeout(event.flow, event.flow.window_counter,
+                                event.time + constants.TIME_DELAY + increment * constants.EPSILON_DELAY)
+                        event.flow.window_counter = event.flow.window_counter + 1
+                        increment = increment + 1
 
-                    newLink = router.transferTo(event.packet)
+                else:
+                    if tracer.enabled and tracer.traces(event):
+                        tracer.emit(event, "DROPPED PACKET " +
+                                event.flow.packetName(event.flow.window_lower))
 
-                    newEvent = Event(event.packet, (newLink, router), "PUT",
-                            event.time, event.flow)
+                    newEvent = self.createEvent(None, None, RESEND, event.time + constants.EPSILON_DELAY, event.flow)
                     self.insertEvent(newEvent)
+                    self.armTimeout(event.flow, event.flow.window_lower,
+                            event.time + constants.TIME_DELAY + constants.EPSILON_DELAY)
 
+                if tracer.enabled and tracer.traces(event):
+                    tracer.emit(event, "Window counter: " + str(event.flow.window_counter) +
+                            " Window size: " + str(event.flow.window_size) +
+                            " Window Upper: " + str(event.flow.window_upper))
 
-            # Host receives packet
-            elif isinstance(event.handler, Host):
-                if(event.packet.data_type == "DATA"):
-                    host = event.handler
-                    host.receive(event.packet)
+                # The ACK has been fully consumed.
+                event.packet.flow.releaseAckPacket(event.packet)
 
-                    result += "Receiving " + event.packet.data_type + str(event.packet.packetID) + " to Host " + str(host.deviceID) + " at time " + str(event.time)
+    def handleGenerateAck(self, event):
+        """ A host generates the acknowledgment for a data packet.
 
-                    newEvent = Event(event.packet, None, "GENERATEACK",
-                            event.time, event.flow)
-                    self.insertEvent(newEvent)
-                elif(event.packet.data_type == "ACK"):
-                    host = event.handler
-                    host.receive(event.packet)
-
-                    result += "Receiving " + event.packet.data_type + str(event.packet.packetID) + " to Host " + str(host.deviceID) + " at time " + str(event.time)
-
-                    isDropped = event.flow.receiveAcknowledgement(event.packet, event.time, self.tcp_type)
-                    event.flow.packet_delay = event.time - event.packet.start_time
-
-
-                    result += "HOST EXPECT: " + str(event.flow.window_lower) + \
-                          " TIME: " + str(event.time) + "\n"
-                    result += "Host received: " + str(event.packet.packetID)
-                    result += "currentTime: " + str(event.time)
-                    result += "packet.start_time: " + str(event.packet.start_time)
-                    result += "self.actual-RTT: " + str(event.flow.actualRTT)
-
-                    # If the packet was dropped, we will do SELECTIVE RESEND (Fast retransmit)
-                    # and only resend the dropped packet. Otherwise, we send packets based on the
-                    # updated window parameters (done in TCP Reno).
-                    if isDropped == False:
-                        result += "ACK Packet " + str(event.packet.packetID) + "acknowledged."
-                        if event.flow.first_time == 0:
-                            # TCP Fast initialization event, which should happen only the first time a packet is acknowledged
-                            if self.tcp_type == 'FAST':
-                                newEvent2 = Event(None, None, "UPDATEWINDOW", event.time + (2*event.flow.actualRTT), event.flow)
-                                self.insertEvent(newEvent2)
-                            event.flow.first_time = 1
-
-                        # used to insert new SELECTPACK (data packet generation) events in order
-                        increment = 1
-                        result += "event.flow.packets_index: " + str(event.flow.packets_index) + "\n"
-                        result += "event.flow.window_upper: " + str(event.flow.window_upper) + "\n"
-                        while(event.flow.window_counter <= event.flow.window_upper):
-                            result += str(event.flow.packets_index) + "\n"
-                            newEvent = Event(None, None, "SELECTPACK", event.time + increment * constants.EPSILON_DELAY, event.flow)
-                            timeoutEvent = Event(None, event.flow.window_counter, "TIMEOUT", event.time + constants.TIME_DELAY + increment * constants.EPSILON_DELAY, event.flow)
-                            self.insertEvent(newEvent)
-                            self.insertEvent(timeoutEvent)
-                            event.flow.window_counter = event.flow.window_counter + 1
-                            increment = increment + 1
-
-                    else:
-                        result += "DROPPED PACKET " + str(event.flow.packets[event.flow.window_lower].packetID)
-
-                        newEvent = Event(None, None, "RESEND", event.time + constants.EPSILON_DELAY, event.flow)
-                        self.insertEvent(newEvent)
-                        timeoutEvent = Event(None, event.flow.window_lower, "TIMEOUT", event.time + constants.TIME_DELAY + constants.EPSILON_DELAY, event.flow)
-                        self.insertEvent(timeoutEvent)
-                    result += "Window counter: " + str(event.flow.window_counter)
-                    result += "Window size: " + str(event.flow.flowID) + " " + str(event.flow.window_size)
-                    result += "Window Upper: " + str(event.flow.window_upper)
-
-            # Inserting another send event...
-            newSendEvent = Event(None, sendLink, "SEND", event.time, event.flow)
-            self.insertEvent(newSendEvent)
+        :param event: The GENERATEACK event to process.
+        :type event: Event
+        """
+        if self.tracer.enabled and self.tracer.traces(event):
+            self.tracer.emit(event, "Generating ACK for " + str(event.packet))
 
+        # Generate the new Ack Packet
+        ackPacket = event.flow.generateAckPacket(event.packet)
+        host = ackPacket.src
+        link = host.getLink()
 
-        elif event.type == "GENERATEACK":
-            # Processes a flow to generate an ACK.
+        # Send the event to put this packet onto the link.
+        newEvent = self.createEvent(ackPacket, (link, host), PUT,
+                event.time, event.flow)
+        self.insertEvent(newEvent)
 
-            # Generate the new Ack Packet
-            result += event.packet.packetID
+    def handleSelectPack(self, event):
+        """ A flow selects the next data packet to send.
 
-            ackPacket = event.flow.generateAckPacket(event.packet)
-            host = ackPacket.src
-            link = host.getLink()
+        :param event: The SELECTPACK event to process.
+        :type event: Event
+        """
+        # Generate the new packet.
+        newPacket = event.flow.selectDataPacket()
+        if(newPacket == None):
+            return
 
-            # Send the event to put this packet onto the link.
-            newEvent = Event(ackPacket, (link, host), "PUT",
-                    event.time, event.flow)
-            self.insertEvent(newEvent)
+        # Setting the "sent time" for the packet.
+        newPacket.start_time = event.time
+        event.flow.recordSend(newPacket.index, event.time)
 
+        if self.tracer.enabled and self.tracer.traces(event):
+            self.tracer.emit(event, "Packet to be sent: " + str(newPacket.data_type) +
+                    str(newPacket) + " at time " + str(event.time))
+        host = newPacket.src
+        link = host.getLink()
 
-        elif event.type == "SELECTPACK":
-            # Processes a flow to generate a regular data packet.
+        # Send the event to put this packet onto the link.
+        newEvent = self.createEvent(newPacket, (link, host), PUT,
+                event.time, event.flow)
+        self.insertEvent(newEvent)
 
-            # Generate the new packet.
-            newPacket = event.flow.selectDataPacket()
-            if(newPacket == None):
-                return
+    def handleResend(self, event):
+        """ A flow resends the dropped packet (fast retransmit).
 
-            # Setting the "sent time" for the packet.
-            newPacket.start_time = event.time
+        :param event: The RESEND event to process.
+        :type event: Event
+        """
+        # In the case of dropped packets, this will start.
+        # We are only resending the dropped packet.
+        newPacket = event.flow.getPacket(event.flow.window_lower)
+        event.flow.recordRetransmit(newPacket.index, event.time)
+
+        if self.tracer.enabled and self.tracer.traces(event):
+            self.tracer.emit(event, "Resending: " + str(newPacket.data_type) +
+                    str(newPacket) + " at time " + str(event.time))
+        # Resetting this packet to the original attributes; they may have been changed on its trip before
+        # it was dropped.
+        newPacket.start_time = event.time
+        newPacket.total_delay = 0
+        newPacket.data_size = constants.DATA_SIZE
+        newPacket.data_type = "DATA"
+        newPacket.currLink = None
+        newPacket.currDev = None
+        newPacket.nextDev = None
+        newPacket.src = event.flow.src
+        newPacket.dest = event.flow.dest
+        newPacket.time = event.time
+
+        host = newPacket.src
+        link = host.getLink()
+
+        # Send the event to put this packet onto the link.
+        newEvent = self.createEvent(newPacket, (link, host), PUT,
+                event.time, event.flow)
+        self.insertEvent(newEvent)
+
+    def handleTimeout(self, event):
+        """ Resends a packet if it still has not been acknowledged
+        TIME_DELAY after it was sent.
+
+        :param event: The TIMEOUT event to process.
+        :type event: Event
+        """
+        # This is the last resort option to detect dropped packets. If an acknowledgment hasn't been
+        # received for a long time then we will resend that packet only. This event will be put into
+        # the queue every time a data packet is selected to be sent.
+        packetIdx = event.handler
+        if self.tracer.enabled and self.tracer.traces(event):
+            self.tracer.emit(event, "TIMEOUT FOR: " + str(packetIdx))
 
+        isAcked = event.flow.checkIfAcked(packetIdx)
 
-            result += "Packet to be sent: " + str(newPacket.data_type) + newPacket.packetID + " at time " + str(event.time)
-            host = newPacket.src
-            link = host.getLink()
+        if isAcked == False:
+            # A packet is dropped. We do the appropriate TCP window size update.
 
-            # Send the event to put this packet onto the link.
-            newEvent = Event(newPacket, (link, host), "PUT",
-                    event.time, event.flow)
-            self.insertEvent(newEvent)
+            if self.tcp_type == 'Reno':
+                event.flow.TCPReno(False)
+                event.flow.timeOut()
 
-        # In the case of dropped packets, this will start.
-        # We are only resending the dropped packet.
-        elif event.type == "RESEND":
-            newPacket = event.flow.packets[event.flow.window_lower]
+            # Selecting the packet that has been timed out.
+            newPacket = event.flow.getPacket(packetIdx)
+            event.flow.recordRetransmit(packetIdx, event.time)
 
-            result += "Resending: " + str(newPacket.data_type) + str(newPacket.packetID) + " at time " + str(event.time)
-            # Resetting this packet to the original attributes; they may have been changed on its trip before
-            # it was dropped.
+            # Resetting this packet to the original attributes;
+            # These attributes might have been altered before it
+            # was dropped.
             newPacket.start_time = event.time
             newPacket.total_delay = 0
             newPacket.data_size = constants.DATA_SIZE
             newPacket.data_type = "DATA"
             newPacket.currLink = None
-            newPacket.currDev = None
+            newPacket.currDev = event.flow.src
             newPacket.nextDev = None
             newPacket.src = event.flow.src
             newPacket.dest = event.flow.dest
@@ -444,63 +954,28 @@ class Simulator:
             host = newPacket.src
             link = host.getLink()
 
-            # Send the event to put this packet onto the link.
-            newEvent = Event(newPacket, (link, host), "PUT",
-                    event.time, event.flow)
+            newEvent = self.createEvent(newPacket, (link, host), PUT, event.time , event.flow)
             self.insertEvent(newEvent)
 
-
-        # This is the last resort option to detect dropped packets. If an acknowledgment hasn't been
-        # received for a long time then we will resend that packet only. This event will be put into
-        # the queue every time a data packet is selected to be sent.
-        elif event.type == "TIMEOUT":
-            packetIdx = event.handler
-            result += "TIMEOUT FOR: " + str(packetIdx) + "\n"
-
-            isAcked = event.flow.checkIfAcked(packetIdx)
-
-            if isAcked == False:
-                # A packet is dropped. We do the appropriate TCP window size update.
-
-                if self.tcp_type == 'Reno':
-                    event.flow.TCPReno(False)
-                    event.flow.timeOut()
-
-                # Selecting the packet that has been timed out.
-                newPacket = event.flow.packets[packetIdx]
-
-                # Resetting this packet to the original attributes;
-                # These attributes might have been altered before it
-                # was dropped.
-                newPacket.start_time = event.time
-                newPacket.total_delay = 0
-                newPacket.data_size = constants.DATA_SIZE
-                newPacket.data_type = "DATA"
-                newPacket.currLink = None
-                newPacket.currDev = event.flow.src
-                newPacket.nextDev = None
-                newPacket.src = event.flow.src
-                newPacket.dest = event.flow.dest
-                newPacket.time = event.time
-
-                host = newPacket.src
-                link = host.getLink()
-
-                newEvent = Event(newPacket, (link, host), "PUT", event.time , event.flow)
-                self.insertEvent(newEvent)
-        
-        # Log all data, every time an event is done being processed.
-        if self.metrics:
-            self.logData(event.time)
-        return result
-
+            # The retransmission can be lost too, so it needs its own timer.
+            self.armTimeout(event.flow, packetIdx, event.time + constants.TIME_DELAY)
 
     def staticRouting(self):
-        result = ""
-        result += "Generating routing tables"
+        """ Seeds the static routing: every router floods its table of
+        neighbors. The routing tables have converged once the resulting
+        events have all been processed. With SPF or incremental routing,
+        the tables are computed right away instead, and no events are
+        scheduled.
+        """
+        if self.routingMode == 'spf':
+            routing.computeRoutingTables(self.network, routing.staticWeight)
+            return
+        if self.routingMode == 'incremental':
+            self.incrementalRouting = routing.IncrementalRouting(self.network,
+                    self.rerouteThreshold)
+            return
 
         for device in self.network.devices:
-            result += str(device)
             device = self.network.devices[device]
             if(isinstance(device, Router)):
                 device.initializeNeighborsTable()
@@ -509,7 +984,5 @@ class Simulator:
                 routingPackets = device.floodNeighbors()
 
                 for pack, link in routingPackets:
-                    newEvent = Event(pack, (link, device), "PUT", 0, flow = None)
+                    newEvent = self.createEvent(pack, (link, device), PUT, 0, flow = None)
                     self.insertEvent(newEvent)
-        return result
-
@@ -0,0 +1,112 @@
+import collections
+import sys
+import events
+
+# A single trace record.
+#   time: simulation time of the event, in ms.
+#   event: name of the event type.
+#   flow: flowID of the event's flow, or None.
+#   link: linkID of the link involved, or None.
+#   message: human-readable description.
+TraceRecord = collections.namedtuple('TraceRecord',
+        ['time', 'event', 'flow', 'link', 'message'])
+
+
+class Tracer:
+    """Collects trace records describing what the simulator does with each
+    event. The simulator checks tracer.enabled and then traces() before
+    building a trace message, so a disabled tracer costs a single
+    attribute lookup per trace point, and records that are filtered out
+    are never formatted.
+    """
+
+    def __init__(self, enabled = False, eventTypes = None, flows = None,
+            links = None, sink = None):
+        """ Instantiates a Tracer.
+
+        :param enabled: Whether any records are emitted at all.
+        :type enabled: bool
+
+        :param eventTypes: If given, only trace these event types.
+        :type eventTypes: list<int>
+
+        :param flows: If given, only trace events of these flows.
+        :type flows: list<str>
+
+        :param links: If given, only trace events involving these links.
+        :type links: list<str>
+
+        :param sink: Called with every TraceRecord that passes the filters.
+            By default, records are printed to stdout.
+        :type sink: function
+        """
+        self.enabled = enabled
+        self.eventTypes = set(eventTypes) if eventTypes is not None else None
+        self.flows = set(flows) if flows is not None else None
+        self.links = set(links) if links is not None else None
+
+        if sink is None:
+            sink = self.printRecord
+        self.sink = sink
+
+    def wants(self, eventType, flow, link):
+        """ Returns True if a record with these attributes passes the filters.
+
+        :param eventType: The type of the event being traced.
+        :type eventType: int
+
+        :param flow: The event's flow.
+        :type flow: Flow/None
+
+        :param link: The link involved in the event.
+        :type link: Link/None
+        """
+        if self.eventTypes is not None and eventType not in self.eventTypes:
+            return False
+        if self.flows is not None and \
+                (flow is None or flow.flowID not in self.flows):
+            return False
+        if self.links is not None and \
+                (link is None or link.linkID not in self.links):
+            return False
+        return True
+
+    def traces(self, event, link = None):
+        """ Returns True if a record about an event passes the filters.
+        Callers check this before building the message they emit.
+
+        :param event: The event being processed.
+        :type event: Event
+
+        :param link: The link involved, if any.
+        :type link: Link
+        """
+        return self.wants(event.type, event.flow, link)
+
+    def emit(self, event, message, link = None):
+        """ Emits a trace record for an event. Callers should check
+        self.enabled and traces() before building the message.
+
+        :param event: The event being processed.
+        :type event: Event
+
+        :param message: Description of what was done.
+        :type message: str
+
+        :param link: The link involved, if any.
+        :type link: Link
+        """
+        self.sink(TraceRecord(event.time, events.EVENT_NAMES[event.type],
+                    event.flow.flowID if event.flow is not None else None,
+                    link.linkID if link is not None else None,
+                    message))
+
+    def printRecord(self, record):
+        """ The default sink: prints a record on one line.
+
+        :param record: The record to print.
+        :type record: TraceRecord
+        """
+        sys.stdout.write("%.6f %-14s %-4s %-4s %s\n" % (record.time,
+                    record.event, record.flow or '-', record.link or '-',
+                    record.message))
@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import classes
+import constants
+import runSimulation
+import scheduler
+import simulation
+
+
+def partialRun(until = None, max_events = None):
+    """ Runs test0.json with Reno until a stopping criterion, and returns
+    its only flow, not yet complete.
+    """
+    parsed_data = json.loads(open(os.path.join(SRC, 'test0.json')).read())
+    network = runSimulation.buildNetwork(parsed_data, quiet = True)
+    simulator = simulation.Simulator(network, 'Reno', None,
+            scheduler.SCHEDULERS['heap']())
+    simulator.staticRouting()
+    simulator.run(stop_when_flows_complete = False)
+    runSimulation.startFlows(simulator)
+    simulator.run(until = until, max_events = max_events)
+    return network.flows.values()[0]
+
+
+class GoodputTest(unittest.TestCase):
+
+    def checkGoodput(self, flow):
+        stats = flow.statistics()
+        self.assertFalse(flow.flowComplete())
+        self.assertTrue(stats['acknowledged'] > 0)
+
+        lastAck = max(t for t in flow.packetTable.ackTime if t == t)
+        megabits = stats['acknowledged'] * constants.DATA_SIZE * 8 / 1048576.0
+        expected = megabits / ((lastAck - flow.flow_start) / 1000.0)
+        self.assertNotEqual(stats['goodput'], 0)
+        self.assertAlmostEqual(stats['goodput'], expected, places = 9)
+        self.assertNotEqual(stats['goodput'], int(stats['goodput']))
+
+    def testFewEvents(self):
+        self.checkGoodput(partialRun(max_events = 1000))
+
+    def testUntil(self):
+        self.checkGoodput(partialRun(until = 2000))
+
+
+class AckScoreboardTest(unittest.TestCase):
+
+    def checkMark(self, board, index, new, cumulative, runs):
+        """ Marks a packet, and checks the cumulative ACK point and the
+        runs after it, given as a dict of start -> end.
+        """
+        self.assertEqual(board.mark(index), new)
+        self.assertTrue(board[index])
+        self.assertEqual(board.cumulative, cumulative)
+        self.assertEqual(board.runEnds, runs)
+        self.assertEqual(board.runStarts, dict((end, start)
+                                               for start, end in runs.items()))
+
+    def testInOrder(self):
+        board = classes.AckScoreboard(4)
+        for i in range(4):
+            self.checkMark(board, i, True, i + 1, {})
+        self.assertEqual(len(board), 4)
+
+    def testOutOfOrder(self):
+        board = classes.AckScoreboard(10)
+        self.checkMark(board, 3, True, 0, {3: 4})
+        self.assertFalse(board[2])
+        # Extends the run on the right, then on the left.
+        self.checkMark(board, 4, True, 0, {3: 5})
+        self.checkMark(board, 2, True, 0, {2: 5})
+        # A separate run further on.
+        self.checkMark(board, 7, True, 0, {2: 5, 7: 8})
+        # The cumulative ACK point jumps over the run after the packet.
+        self.checkMark(board, 0, True, 1, {2: 5, 7: 8})
+        self.checkMark(board, 1, True, 5, {7: 8})
+
+    def testDuplicate(self):
+        board = classes.AckScoreboard(6)
+        self.checkMark(board, 0, True, 1, {})
+        self.checkMark(board, 0, False, 1, {})
+        self.checkMark(board, 3, True, 1, {3: 4})
+        self.checkMark(board, 3, False, 1, {3: 4})
+
+    def testFillGap(self):
+        board = classes.AckScoreboard(10)
+        self.checkMark(board, 2, True, 0, {2: 3})
+        self.checkMark(board, 4, True, 0, {2: 3, 4: 5})
+        self.checkMark(board, 5, True, 0, {2: 3, 4: 6})
+        # Filling the gap merges the runs on both sides.
+        self.checkMark(board, 3, True, 0, {2: 6})
+        self.checkMark(board, 8, True, 0, {2: 6, 8: 9})
+        self.checkMark(board, 7, True, 0, {2: 6, 7: 9})
+        self.checkMark(board, 6, True, 0, {2: 9})
+        self.checkMark(board, 9, True, 0, {2: 10})
+        self.checkMark(board, 1, True, 0, {1: 10})
+        self.checkMark(board, 0, True, 10, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
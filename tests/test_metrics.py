@@ -0,0 +1,65 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import metrics
+
+
+class MultiplexedSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.chunkRecords = metrics.SPOOL_CHUNK_RECORDS
+
+    def tearDown(self):
+        metrics.SPOOL_CHUNK_RECORDS = self.chunkRecords
+        shutil.rmtree(self.directory)
+
+    def checkSink(self, seriesIDs, recordCount, chunkRecords):
+        """ Writes random records to a sink, closes it with the given chunk
+        size, and checks every series read back against what was written.
+        """
+        metrics.SPOOL_CHUNK_RECORDS = chunkRecords
+        rng = random.Random(7)
+        name = os.path.join(self.directory, 'metrics.bin')
+        sink = metrics.MultiplexedSink(name, seriesIDs)
+        written = dict(((series, metric), []) for series in range(len(seriesIDs))
+                       for metric in range(3))
+        for i in range(recordCount):
+            series = rng.randrange(len(seriesIDs))
+            metric = rng.randrange(3)
+            record = (i * 0.1, rng.random())
+            sink.write(series, metric, record[0], record[1])
+            written[(series, metric)].append(record)
+        sink.close()
+
+        self.assertFalse(os.path.exists(sink.spool))
+        for (series, metric), records in written.items():
+            expected = np.array(records, dtype = float).reshape(-1, 2)
+            for times, values in (sink.read(series, metric),
+                    metrics.readMultiplexed(name, seriesIDs[series], metric)):
+                self.assertTrue(np.array_equal(times, expected[:, 0]))
+                self.assertTrue(np.array_equal(values, expected[:, 1]))
+
+    def testSmallChunks(self):
+        # Chunks much smaller than the spool, and than the sink's buffer.
+        self.checkSink(['L%d' % i for i in range(20)] + ['F1', 'F2'], 10000, 7)
+
+    def testSingleChunk(self):
+        self.checkSink(['L1', 'F1'], 500, 65536)
+
+    def testEmpty(self):
+        self.checkSink(['L1', 'F1'], 0, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import routing
+import runSimulation
+
+
+class IncrementalRoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        parsed_data = json.loads(open(os.path.join(SRC, 'test2.json')).read())
+        self.network = runSimulation.buildNetwork(parsed_data, quiet = True)
+        self.routing = routing.IncrementalRouting(self.network, 0.2)
+        self.tables = dict((router, router.rout_table)
+                           for router in self.routing.routers)
+        self.copies = dict((router, dict(router.rout_table))
+                           for router in self.routing.routers)
+
+        # A link on the shortest paths of some router.
+        self.link = sorted(self.routing.trees[self.routing.routers[0]],
+                           key = lambda link: link.linkID)[0]
+
+    def testBelowThreshold(self):
+        costs = dict(self.routing.costs)
+        self.link.delay *= 1.15
+        self.assertEqual(self.routing.update(), (0, 0))
+        self.assertEqual(self.routing.costs, costs)
+        for router in self.routing.routers:
+            self.assertIs(router.rout_table, self.tables[router])
+            self.assertEqual(router.rout_table, self.copies[router])
+
+    def testAboveThreshold(self):
+        self.link.delay *= 10
+        changed, recomputed = self.routing.update()
+        self.assertEqual(changed, 1)
+        self.assertTrue(recomputed > 0)
+        self.assertIsNot(self.routing.routers[0].rout_table,
+                         self.tables[self.routing.routers[0]])
+        for router in self.routing.routers:
+            self.assertEqual(router.rout_table,
+                             routing.shortestPaths(router, routing.dynamicWeight))
+
+
+if __name__ == '__main__':
+    unittest.main()
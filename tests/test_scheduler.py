@@ -0,0 +1,192 @@
+import heapq
+import os
+import random
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import scheduler
+
+
+class StubEvent(object):
+    """Just what the schedulers look at: a time, and a packet or None."""
+
+    def __init__(self, time, packet = None):
+        self.time = time
+        self.packet = packet
+
+
+class CalendarSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(3)
+        self.calendar = scheduler.CalendarScheduler()
+        self.oracle = []
+        self.counter = 0
+
+    def put(self, time, reserved = False):
+        """ Puts an event with a random priority class into the calendar
+        and the oracle. A reserved event gets its sequence from reserve().
+        """
+        event = StubEvent(time, self.rng.choice([None, 'packet']))
+        if event.packet is None:
+            priority = scheduler.PRIORITY_NOPACKET
+        else:
+            priority = scheduler.PRIORITY_PACKET
+        if reserved:
+            sequence = self.calendar.reserve()
+            self.assertEqual(sequence, self.counter)
+            self.calendar.put(event, sequence)
+        else:
+            sequence = self.counter
+            self.calendar.put(event)
+        self.counter += 1
+        heapq.heappush(self.oracle, (time, priority, sequence, event))
+
+    def get(self):
+        """ Pops the next event from both, and checks they agree.
+        """
+        key = self.oracle[0][:3]
+        self.assertEqual(self.calendar.qsize(), len(self.oracle))
+        self.assertEqual(self.calendar.peekTime(), key[0])
+        self.assertEqual(self.calendar.peekKey(), key)
+        self.assertIs(self.calendar.get(), heapq.heappop(self.oracle)[3])
+
+    def drain(self):
+        while self.oracle:
+            self.get()
+        self.assertTrue(self.calendar.empty())
+        self.assertRaises(IndexError, self.calendar.get)
+
+    def testTies(self):
+        # Few distinct times, so most events tie on time and priority.
+        for i in range(2000):
+            self.put(self.rng.randrange(20) * 0.5, self.rng.random() < 0.3)
+        self.drain()
+
+    def testEarlierThanCurrentDay(self):
+        # Let the calendar move ahead, then insert before its current day.
+        for i in range(500):
+            self.put(self.rng.uniform(0, 1000))
+        for i in range(3000):
+            if self.oracle and self.rng.random() < 0.5:
+                self.get()
+            else:
+                now = self.oracle[0][0] if self.oracle else 0
+                self.put(max(0, now - self.rng.uniform(0, 50)),
+                         self.rng.random() < 0.3)
+        self.drain()
+
+    def testHoldModel(self):
+        # Pop one event and schedule a later one, as a simulation does.
+        for i in range(300):
+            self.put(self.rng.expovariate(1.0))
+        for i in range(20000):
+            now = self.oracle[0][0]
+            self.get()
+            delay = self.rng.choice([0, self.rng.expovariate(1.0),
+                                     self.rng.uniform(0, 10000)])
+            self.put(now + delay, self.rng.random() < 0.3)
+        self.drain()
+
+    def testSparse(self):
+        # Events far apart, so the calendar must jump over empty years.
+        for i in range(200):
+            self.put(self.rng.choice([self.rng.uniform(0, 1e6),
+                                      self.rng.randrange(10) * 1e5]))
+        self.drain()
+
+    def testGrowAndShrink(self):
+        # Resize up and down several times.
+        for round in range(3):
+            for i in range(5000):
+                self.put(self.rng.uniform(0, 100) + round * 100)
+            for i in range(4990):
+                self.get()
+        self.drain()
+
+
+class TimingWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(5)
+
+    def checkWheel(self, wheel, steps, delays):
+        """ Runs random arm, cancel and advance operations on a wheel, and
+        checks it against a set of the armed timers.
+
+        An advance returns the timers armed for an already released tick,
+        if there are any; otherwise those of the earliest armed tick, if it
+        is not past the target tick.
+        """
+        resolution = wheel.resolution
+        armed = set()
+        released = set()
+        order = {}
+        tick = 0
+        for step in range(steps):
+            action = self.rng.random()
+            if action < 0.4:
+                if tick > 0 and self.rng.random() < 0.1:
+                    time = self.rng.uniform(0, tick * resolution - 1e-9)
+                else:
+                    time = tick * resolution + self.rng.uniform(0, self.rng.choice(delays))
+                timer = wheel.arm(time, object())
+                order[timer] = step
+                self.assertEqual(timer.tick, int(time / resolution))
+                armed.add(timer)
+            elif action < 0.6:
+                if armed and self.rng.random() < 0.7:
+                    timer = self.rng.choice(sorted(armed, key = order.get))
+                    armed.discard(timer)
+                    self.assertTrue(wheel.cancel(timer))
+                elif released:
+                    timer = self.rng.choice(sorted(released, key = order.get))
+                    self.assertFalse(wheel.cancel(timer))
+            else:
+                time = tick * resolution + self.rng.uniform(-resolution,
+                                                            self.rng.choice(delays))
+                target = int(time / resolution)
+                overdue = set(t for t in armed if t.tick < tick)
+                if overdue:
+                    expected = overdue
+                else:
+                    first = min([t.tick for t in armed if t.tick <= target] or [None])
+                    expected = set(t for t in armed if t.tick == first)
+                    if first is not None:
+                        tick = first + 1
+                    elif target >= tick:
+                        tick = target + 1
+                fired = wheel.advance(time)
+                self.assertEqual(len(fired), len(set(fired)))
+                self.assertEqual(set(fired), expected)
+                armed -= expected
+                released |= expected
+
+            self.assertEqual(wheel.size, len(armed))
+            self.assertEqual(wheel.empty(), not armed)
+            if armed:
+                self.assertEqual(wheel.nextTime(), min(t.time for t in armed))
+
+        while armed:
+            fired = wheel.advance(max(t.time for t in armed))
+            self.assertTrue(fired)
+            armed -= set(fired)
+        self.assertTrue(wheel.empty())
+
+    def testNearTimers(self):
+        self.checkWheel(scheduler.TimingWheel(0.5), 5000, [3, 40, 200])
+
+    def testSeveralLevels(self):
+        # Delays up to three levels deep, so timers cascade more than once.
+        self.checkWheel(scheduler.TimingWheel(1.0, 3), 3000, [10, 1000, 100000])
+
+    def testBeyondTopLevel(self):
+        # Delays past the range of the top level are re-filed.
+        self.checkWheel(scheduler.TimingWheel(1.0, 2), 2000, [10, 500, 200000])
+
+
+if __name__ == '__main__':
+    unittest.main()